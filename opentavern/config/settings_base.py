@@ -78,6 +78,29 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/1.6/topics/cache/
+# Local memory is private to each process. Set TAVERN_CACHE_DIR to share
+# a file based cache between the processes of a host.
+
+TAVERN_CACHE_DIR = os.environ.get('TAVERN_CACHE_DIR')
+
+if TAVERN_CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': TAVERN_CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'opentavern',
+        }
+    }
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.6/topics/i18n/
 
@@ -136,6 +159,9 @@ AUTHENTICATION_BACKENDS = (
     "django.contrib.auth.backends.ModelBackend",
     # 'allauth' specific authentication methods, such as login by e-mail
     "allauth.account.auth_backends.AuthenticationBackend",
+    # group and event permissions from their roles, see
+    # TAVERN_ROLE_PERMISSIONS
+    "tavern.backends.RoleBackend",
     # per object permission from guardian
     "guardian.backends.ObjectPermissionBackend",
 )
@@ -159,3 +185,62 @@ ANONYMOUS_USER_ID = -1
 GUARDIAN_RENDER_403 = True
 
 DEFAULT_USER_STATUS = False
+
+# Tavern specific configuration
+
+# Number of groups listed per page on the home page
+TAVERN_GROUPS_PER_PAGE = 50
+
+# Maximum number of events shown in an event listing
+TAVERN_EVENTS_LIMIT = 10
+
+# Derive the change and delete permissions of groups and events from
+# their creators and organizers instead of guardian's per object rows,
+# which are then no longer written. Checks which are denied still fall
+# through to guardian's backend until it is removed from
+# AUTHENTICATION_BACKENDS.
+TAVERN_ROLE_PERMISSIONS = False
+
+# Seconds event listings stay cached; RSVP counts shown in them may lag
+# by as much
+TAVERN_EVENTS_CACHE_TIMEOUT = 300
+
+# RSVP and membership notifications are queued and delivered by the
+# send_notifications command through this backend, in batches of
+# TAVERN_NOTIFICATION_BATCH_SIZE spread over TAVERN_NOTIFICATION_THREADS
+# threads. Failed ones are retried up to TAVERN_NOTIFICATION_MAX_ATTEMPTS
+# times, TAVERN_NOTIFICATION_RETRY_DELAY seconds later, doubled on each
+# attempt. A batch is left to the worker which claimed it for
+# TAVERN_NOTIFICATION_CLAIM_TIMEOUT seconds, then taken again.
+TAVERN_NOTIFICATION_BACKEND = 'tavern.notifications.EmailBackend'
+TAVERN_NOTIFICATION_BATCH_SIZE = 100
+TAVERN_NOTIFICATION_THREADS = 4
+TAVERN_NOTIFICATION_MAX_ATTEMPTS = 5
+TAVERN_NOTIFICATION_RETRY_DELAY = 60
+TAVERN_NOTIFICATION_CLAIM_TIMEOUT = 600
+
+# Seconds before an event starts its attendees are reminded of it, by the
+# schedule_reminders command
+TAVERN_REMINDER_LEAD_TIME = 24 * 60 * 60
+
+# Number of groups and events shown per page of search results
+TAVERN_SEARCH_RESULTS_PER_PAGE = 20
+
+# Number of the newest matches of a search that are ranked; words found in
+# most groups and events would otherwise rank every one of them
+TAVERN_SEARCH_MAX_MATCHES = 1000
+
+# Maximum number of usernames suggested when editing organizers
+TAVERN_AUTOCOMPLETE_LIMIT = 10
+
+# Number of members listed per page of a group's member directory
+TAVERN_MEMBERS_PER_PAGE = 50
+
+# Number of attendees listed per page of an event
+TAVERN_ATTENDEES_PER_PAGE = 50
+
+# Seconds pages rendered for anonymous visitors, and the member and
+# attendee fragments of detail pages, stay cached. Writes drop them at
+# once; this bounds how long they lag the clock, e.g. an event becoming
+# past
+TAVERN_PAGE_CACHE_TIMEOUT = 60
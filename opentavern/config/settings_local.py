@@ -9,3 +9,6 @@ INSTALLED_APPS += (
 
 
 ALLOWED_HOSTS = ('*')
+
+# Print notification mails instead of sending them
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
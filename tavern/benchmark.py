@@ -0,0 +1,397 @@
+"""
+Query count and wall-clock benchmarks for every named URL.
+
+``seed`` fills the database with a synthetic dataset and ``run`` renders
+each URL of ``tavern.urls`` and ``accounts.urls`` against it, comparing
+the number of queries and the time taken with the budgets in
+``SCENARIOS``. Budgets must not depend on the size of the dataset, so a
+page that starts issuing a query per row fails as soon as the dataset
+grows. Used by the ``benchmark_urls`` management command and the tests.
+
+``time_lookups`` times the hot database lookups on their own, for the
+``benchmark_lookups`` management command to compare them with and
+without their indexes, and ``time_slug_collisions`` the saving of
+events whose slugs collide, for ``benchmark_slugs``.
+"""
+import re
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse, RegexURLPattern
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.importlib import import_module
+
+from . import bulk, listings, search
+from .models import TavernGroup, Membership, Event, Attendee, \
+    recount_counters
+
+URLCONFS = ('tavern.urls', 'accounts.urls')
+
+BATCH_SIZE = 500
+
+PASSWORD = 'bench'
+
+# Transaction bookkeeping is not counted: atomic blocks issue BEGIN on
+# their own but savepoints inside the transaction a test runs in, so
+# counting it would make budgets differ in and out of tests. SQLite
+# logs its queries as "QUERY = u'...' - PARAMS = (...)".
+TRANSACTION_RE = re.compile(
+    r"^(QUERY = u?')?(BEGIN|(RELEASE |ROLLBACK TO )?SAVEPOINT )")
+
+
+class Scenario(object):
+    """
+    How to request one named URL and what it may cost. ``max_queries``
+    may be a function of the fixtures, for URLs streaming their rows
+    with one query per batch.
+    """
+
+    def __init__(self, name, max_queries, method='get', anonymous=False,
+                 kwargs=None, data=None, status=(200,), max_seconds=0.5):
+        self.name = name
+        self.max_queries = max_queries
+        self.method = method
+        self.anonymous = anonymous
+        self.kwargs = kwargs or (lambda fixtures: {})
+        self.data = data or (lambda fixtures: {})
+        self.status = status
+        self.max_seconds = max_seconds
+
+    @property
+    def label(self):
+        if self.anonymous:
+            return '%s (anonymous)' % self.name
+        return self.name
+
+
+def _batches(queries, model, lookup, fixture):
+    """
+    Budget of a URL streaming the ``model`` rows matching ``lookup`` of
+    a fixture in batches: ``queries`` plus one query per batch.
+    """
+    def max_queries(fixtures):
+        rows = model.objects.filter(**{lookup: fixtures[fixture]}).count()
+        return queries + rows // bulk.BATCH_SIZE + 1
+    return max_queries
+
+
+# Scenarios run in order, so the ones deleting fixtures come last.
+SCENARIOS = [
+    Scenario('index', 9),
+    Scenario('index', 1, anonymous=True),
+    Scenario('tavern_search', 3, anonymous=True,
+             data=lambda f: {'q': f['group'].name}),
+    Scenario('tavern_group_details', 13,
+             kwargs=lambda f: {'slug': f['group'].slug}),
+    Scenario('tavern_group_details', 9, anonymous=True,
+             kwargs=lambda f: {'slug': f['group'].slug}),
+    Scenario('group_events_feed', 2, anonymous=True,
+             kwargs=lambda f: {'slug': f['group'].slug, 'when': 'upcoming'},
+             data=lambda f: {'after': listings.cursor(f['event'])}),
+    Scenario('group_events_feed', 2, anonymous=True,
+             kwargs=lambda f: {'slug': f['group'].slug, 'when': 'past'},
+             data=lambda f: {'after': listings.cursor(f['event'])}),
+    Scenario('group_members', 2, anonymous=True,
+             kwargs=lambda f: {'slug': f['group'].slug}),
+    Scenario('group_members_feed', 2, anonymous=True,
+             kwargs=lambda f: {'slug': f['group'].slug},
+             data=lambda f: {'after': listings.make_cursor(timezone.now(),
+                                                           0)}),
+    Scenario('tavern_event_details', 10,
+             kwargs=lambda f: {'group': f['group'].slug,
+                               'slug': f['event'].slug}),
+    Scenario('tavern_event_details', 3, anonymous=True,
+             kwargs=lambda f: {'group': f['group'].slug,
+                               'slug': f['event'].slug}),
+    Scenario('tavern_create_group', 2),
+    Scenario('tavern_group_update', 6,
+             kwargs=lambda f: {'slug': f['group'].slug}),
+    Scenario('export_group_events', _batches(1, Event, 'group', 'group'),
+             kwargs=lambda f: {'slug': f['group'].slug}),
+    Scenario('export_group_events', _batches(1, Event, 'group', 'group'),
+             anonymous=True,
+             kwargs=lambda f: {'slug': f['group'].slug},
+             data=lambda f: {'format': 'ics'}),
+    Scenario('export_group_attendees', _batches(6, Attendee, 'event__group', 'group'),
+             kwargs=lambda f: {'slug': f['group'].slug}),
+    Scenario('edit_organizers', 6,
+             kwargs=lambda f: {'slug': f['group'].slug}),
+    Scenario('organizer_autocomplete', 7,
+             kwargs=lambda f: {'slug': f['group'].slug},
+             data=lambda f: {'q': 'bench-1'}),
+    Scenario('import_rsvps', 12, method='post',
+             kwargs=lambda f: {'group': f['group'].slug,
+                               'slug': f['event'].slug},
+             data=lambda f: {'file': SimpleUploadedFile(
+                 'rsvps.csv', 'username,rsvp_status\nbench-0,no\n'
+                 'bench-1,maybe\n%s,yes\n' % f['user'].username)}),
+    Scenario('export_rsvps', _batches(5, Attendee, 'event', 'event'),
+             kwargs=lambda f: {'group': f['group'].slug,
+                               'slug': f['event'].slug}),
+    Scenario('tavern_event_ical', 1, anonymous=True,
+             kwargs=lambda f: {'group': f['group'].slug,
+                               'slug': f['event'].slug}),
+    Scenario('tavern_create_event', 3),
+    Scenario('tavern_event_update', 7,
+             kwargs=lambda f: {'slug': f['event'].slug}),
+    Scenario('rsvp_statuses', 3,
+             data=lambda f: {'events': ','.join(
+                 str(event.pk) for event in listings.upcoming_events())}),
+    Scenario('change_rsvp', 8,
+             kwargs=lambda f: {'event_id': f['event'].pk,
+                               'rsvp_status': 'maybe'}),
+    Scenario('tavern_toggle_member', 8, method='post',
+             data=lambda f: {'user_id': f['user'].pk,
+                             'slug': f['other_group'].slug}),
+    Scenario('change_password', 2),
+    Scenario('signup', 0, anonymous=True),
+    Scenario('signin', 8, method='post', anonymous=True, status=(302,),
+             data=lambda f: {'username': f['user'].username,
+                             'password': PASSWORD}),
+    Scenario('edit_organizers', 15, method='post', status=(302,),
+             kwargs=lambda f: {'slug': f['group'].slug},
+             data=lambda f: {'action': 'add',
+                             'usernames': ','.join(User.objects.filter(
+                                 username__startswith='bench-')
+                                 .values_list('username', flat=True)[:20])}),
+    Scenario('delete_rsvp', 8, method='post', status=(302,),
+             kwargs=lambda f: {'pk': f['attendee'].pk}),
+    Scenario('delete_event', 12, method='post', status=(302,),
+             kwargs=lambda f: {'slug': f['victim_event'].slug}),
+    Scenario('delete_group', 13, method='post', status=(302,),
+             kwargs=lambda f: {'slug': f['victim_group'].slug}),
+]
+
+
+def url_names(urlconfs=URLCONFS):
+    """ Names of all the URLs declared in ``urlconfs`` """
+    names = set()
+    for urlconf in urlconfs:
+        for pattern in import_module(urlconf).urlpatterns:
+            if isinstance(pattern, RegexURLPattern) and pattern.name:
+                names.add(pattern.name)
+    return names
+
+
+def _bulk_create(model, objs):
+    model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+
+
+def seed(groups=100, events=10, members=50, attendees=50):
+    """
+    Creates ``groups`` groups, each with ``members`` members and
+    ``events`` events of ``attendees`` attendees, plus the fixtures the
+    scenarios request. Bulk inserted rows skip ``save()`` and signals;
+    the fixtures are saved normally so they get slugs and permissions.
+    """
+    now = timezone.now()
+    user = User.objects.create_user(username='bench',
+                                    email='bench@agiliq.com',
+                                    password=PASSWORD)
+    pool_size = max(members, attendees, 1)
+    _bulk_create(User, [User(username='bench-%s' % i,
+                             email='bench-%s@agiliq.com' % i,
+                             password='!')
+                        for i in range(pool_size)])
+    pool = list(User.objects.filter(username__startswith='bench-')
+                .order_by('pk').values_list('pk', flat=True))
+
+    _bulk_create(TavernGroup, [TavernGroup(name='Bench group %s' % i,
+                                           slug='bench-group-%s' % i,
+                                           description='Benchmark group',
+                                           creator_id=pool[0])
+                               for i in range(groups)])
+    group_ids = list(TavernGroup.objects.filter(slug__startswith='bench-group-')
+                     .order_by('pk').values_list('pk', flat=True))
+
+    for index, group_id in enumerate(group_ids):
+        member_ids = pool[:members]
+        if index % 2:
+            member_ids = member_ids + [user.pk]
+        _bulk_create(Membership, [Membership(user_id=member_id,
+                                             tavern_group_id=group_id,
+                                             join_date=now)
+                                  for member_id in member_ids])
+        _bulk_create(Event, [Event(group_id=group_id,
+                                   name='Bench event %s' % i,
+                                   slug='bench-event-%s-%s' % (group_id, i),
+                                   description='Benchmark event',
+                                   starts_at=now + timedelta(days=i - events / 2),
+                                   ends_at=now + timedelta(days=i - events / 2, hours=2),
+                                   creator_id=pool[0])
+                             for i in range(events)])
+
+    statuses = [choice for choice, label in Attendee.RSVP_CHOICES]
+    event_ids = list(Event.objects.filter(slug__startswith='bench-event-')
+                     .order_by('pk').values_list('pk', flat=True))
+    for index, event_id in enumerate(event_ids):
+        attendee_ids = pool[:attendees]
+        if index % 3 == 0:
+            attendee_ids = attendee_ids + [user.pk]
+        _bulk_create(Attendee, [Attendee(user_id=attendee_id,
+                                         event_id=event_id,
+                                         rsvped_on=now,
+                                         rsvp_status=statuses[i % len(statuses)])
+                                for i, attendee_id in enumerate(attendee_ids)])
+
+    group = TavernGroup(name='Bench home', description='Benchmark home group',
+                        creator=user)
+    group.save()
+    group.organizers.add(User.objects.get(pk=pool[0]))
+    _bulk_create(Membership, [Membership(user_id=member_id,
+                                         tavern_group=group,
+                                         join_date=now)
+                              for member_id in pool[:members]])
+    event = Event.objects.create(group=group, name='Bench home event',
+                                 description='Benchmark home event',
+                                 starts_at=now + timedelta(days=1),
+                                 ends_at=now + timedelta(days=1, hours=2),
+                                 location='Hyderabad', creator=user)
+    _bulk_create(Attendee, [Attendee(user_id=attendee_id, event=event,
+                                     rsvped_on=now, rsvp_status='yes')
+                            for attendee_id in pool[:attendees]])
+    recount_counters()
+    search.rebuild()
+
+    other_group = TavernGroup(name='Bench other', description='Not joined',
+                              creator=User.objects.get(pk=pool[0]))
+    other_group.save()
+    victim_group = TavernGroup(name='Bench victim', description='Deleted',
+                               creator=user)
+    victim_group.save()
+    victim_event = Event.objects.create(group=victim_group,
+                                        name='Bench victim event',
+                                        description='Deleted',
+                                        starts_at=now + timedelta(days=1),
+                                        ends_at=now + timedelta(days=1, hours=2),
+                                        creator=user)
+    return {'user': user,
+            'group': group,
+            'event': event,
+            'attendee': Attendee.objects.get(user=user, event=event),
+            'other_group': other_group,
+            'victim_group': victim_group,
+            'victim_event': victim_event}
+
+
+def run(fixtures, scenarios=None, check_time=True):
+    """
+    Requests every scenario and returns one result dict per scenario.
+    A result is ``ok`` when the status is expected and the query (and,
+    with ``check_time``, the time) budget is respected.
+    """
+    if scenarios is None:
+        scenarios = SCENARIOS
+    cache.clear()
+    anonymous = Client()
+    logged_in = Client()
+    logged_in.login(username=fixtures['user'].username, password=PASSWORD)
+
+    results = []
+    for scenario in scenarios:
+        client = anonymous if scenario.anonymous else logged_in
+        path = reverse(scenario.name, kwargs=scenario.kwargs(fixtures))
+        request = getattr(client, scenario.method)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.time()
+            response = request(path, scenario.data(fixtures))
+            if response.streaming:
+                ''.join(response.streaming_content)
+            seconds = time.time() - started
+
+        count = len([query for query in queries
+                     if not TRANSACTION_RE.match(query['sql'])])
+        max_queries = scenario.max_queries
+        if callable(max_queries):
+            max_queries = max_queries(fixtures)
+        ok = (response.status_code in scenario.status and
+              count <= max_queries)
+        if check_time:
+            ok = ok and seconds <= scenario.max_seconds
+        results.append({'name': scenario.label,
+                        'method': scenario.method.upper(),
+                        'path': path,
+                        'status': response.status_code,
+                        'queries': count,
+                        'max_queries': max_queries,
+                        'seconds': round(seconds, 4),
+                        'max_seconds': scenario.max_seconds,
+                        'ok': ok})
+    return results
+
+
+# The hot lookups of the views, by name. They are timed before and after
+# the migrations adding their indexes, so they only read columns the
+# tables have either way, not whole rows of the current models.
+EVENT_COLUMNS = ('pk', 'group', 'name', 'slug', 'starts_at', 'yes_count')
+GROUP_COLUMNS = ('pk', 'name', 'slug', 'member_count')
+ATTENDEE_COLUMNS = ('pk', 'user', 'event', 'rsvp_status')
+
+LOOKUPS = [
+    ('upcoming events', lambda f: list(
+        Event.visible_events.upcoming().values_list(*EVENT_COLUMNS)[:10])),
+    ('upcoming events of a group', lambda f: list(
+        Event.visible_events.upcoming().filter(group=f['group'])
+        .values_list(*EVENT_COLUMNS)[:10])),
+    ('group by slug', lambda f: TavernGroup.objects.values_list(
+        *GROUP_COLUMNS).get(slug=f['group'].slug)),
+    ('event by group and slug', lambda f: Event.objects.values_list(
+        *EVENT_COLUMNS).get(group__slug=f['group'].slug,
+                            slug=f['event'].slug)),
+    ('yes RSVPs of an event', lambda f: list(Attendee.objects.filter(
+        event=f['event'], rsvp_status='yes').values_list(
+        *ATTENDEE_COLUMNS)[:50])),
+    ('yes RSVPs of a user', lambda f: list(Attendee.objects.filter(
+        user=f['user'], rsvp_status='yes').values_list(
+        *ATTENDEE_COLUMNS)[:50])),
+]
+
+
+def time_lookups(fixtures, repeat=5):
+    """ Best time, out of ``repeat`` runs, of each of the ``LOOKUPS`` """
+    results = []
+    for name, lookup in LOOKUPS:
+        timings = []
+        for i in range(repeat):
+            started = time.time()
+            lookup(fixtures)
+            timings.append(time.time() - started)
+        results.append({'name': name, 'seconds': round(min(timings), 6)})
+    return results
+
+
+def time_slug_collisions(count=500, sample=50):
+    """
+    Creates ``count`` events in one group whose names all slugify alike
+    and returns the average queries and seconds of the last ``sample``
+    saves.
+    """
+    user = User.objects.create_user(username='bench-slugs', password=PASSWORD)
+    group = TavernGroup(name='Bench slugs', description='Slug collisions',
+                        creator=user)
+    group.save()
+    now = timezone.now()
+    queries = seconds = 0
+    for i in range(count):
+        event = Event(group=group, creator=user, description='Collides',
+                      name='Weekly meetup' + '!' * (i % 150) + '?' * (i // 150),
+                      starts_at=now, ends_at=now)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.time()
+            event.save()
+            elapsed = time.time() - started
+        if i >= count - sample:
+            queries += len([query for query in captured
+                            if not TRANSACTION_RE.match(query['sql'])])
+            seconds += elapsed
+    sample = min(sample, count)
+    return {'count': count,
+            'last_slug': event.slug,
+            'queries_per_save': float(queries) / sample,
+            'seconds_per_save': round(seconds / sample, 6)}
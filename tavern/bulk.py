@@ -0,0 +1,192 @@
+"""
+Bulk import and export of RSVPs.
+
+Rows are read, written and fetched in batches of ``BATCH_SIZE`` so that
+memory use does not grow with the size of the upload or of the event.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import pagecache
+from .models import Event, Attendee
+
+BATCH_SIZE = 500
+
+# Errors beyond this many are counted but not reported one by one.
+MAX_REPORTED_ERRORS = 100
+
+
+class Echo(object):
+    """ File-like object handing back what is written, for streaming csv """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """ Yields each row of ``rows`` as a line of CSV """
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow([unicode(value).encode('utf-8')
+                               for value in row])
+
+
+def stream_json_lines(rows, fields):
+    """ Yields each row of ``rows`` as a JSON object on its own line """
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row))) + '\n'
+
+
+def iterate_in_batches(queryset, *fields):
+    """
+    Yields ``fields`` of every row of ``queryset`` in primary key order,
+    one batch per query. Database drivers buffer the whole result of a
+    query, even with ``.iterator()``, so a single query would not keep
+    memory flat.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        batch = queryset
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        rows = list(batch.values_list('pk', *fields)[:BATCH_SIZE])
+        for row in rows:
+            yield row[1:]
+        if len(rows) < BATCH_SIZE:
+            return
+        last_pk = rows[-1][0]
+
+
+def read_csv(fileobj):
+    """
+    Yields ``(line, username, rsvp_status)`` from CSV rows of a username
+    and a status. A ``username,rsvp_status`` header is skipped.
+    """
+    for line, row in enumerate(csv.reader(fileobj), 1):
+        if not row or (line == 1 and row == ['username', 'rsvp_status']):
+            continue
+        row += [''] * (2 - len(row))
+        # Left encoded; import_rsvps rejects what isn't UTF-8
+        yield line, row[0].strip(), row[1].strip()
+
+
+def read_json_lines(fileobj):
+    """
+    Yields ``(line, username, rsvp_status)`` from lines holding a JSON
+    object with ``username`` and ``rsvp_status`` keys.
+    """
+    for line, text in enumerate(fileobj, 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+            yield line, row.get('username', u''), row.get('rsvp_status', '')
+        except (ValueError, AttributeError):
+            yield line, None, None
+
+
+def import_rsvps(event, rows):
+    """
+    Sets the RSVPs of ``event`` from ``(line, username, rsvp_status)``
+    rows, as read by ``read_csv`` or ``read_json_lines``. Rows which
+    can't be used are rejected with the reason, among them a username
+    repeated within a batch, so every row is counted once. Each batch
+    of rows costs one query to resolve usernames, one to find existing
+    RSVPs, a bulk insert and at most one update per status. Returns a
+    summary of what was done and of the rows which were rejected.
+    """
+    statuses = dict(Attendee.RSVP_CHOICES)
+    summary = {'created': 0, 'updated': 0, 'unchanged': 0,
+               'rejected': 0, 'errors': []}
+
+    def reject(line, error):
+        summary['rejected'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'line': line, 'error': error})
+
+    rows = iter(rows)
+    with transaction.atomic():
+        # Serializes with Attendee.objects.set_rsvp on this event.
+        event = Event.objects.select_for_update().get(pk=event.pk)
+        now = timezone.now()
+        while True:
+            batch = list(islice(rows, BATCH_SIZE))
+            if not batch:
+                break
+
+            wanted = {}
+            for line, username, rsvp_status in batch:
+                if isinstance(username, str):
+                    try:
+                        username = username.decode('utf-8')
+                    except UnicodeDecodeError:
+                        reject(line, "Username is not UTF-8")
+                        continue
+                if username is not None and \
+                        not isinstance(username, unicode):
+                    reject(line, "Invalid username %r" % (username,))
+                    continue
+                username = (username or u'').strip()
+                if not username:
+                    reject(line, "Missing username")
+                elif not isinstance(rsvp_status, basestring) or \
+                        rsvp_status not in statuses:
+                    reject(line, "Invalid RSVP status %r" % (rsvp_status,))
+                elif username in wanted:
+                    reject(line, "%s is also on line %s" % (
+                        username, wanted[username][0]))
+                else:
+                    wanted[username] = (line, rsvp_status)
+
+            user_ids = dict(User.objects.filter(username__in=wanted.keys())
+                            .values_list('username', 'pk'))
+            for username, (line, rsvp_status) in wanted.items():
+                if username not in user_ids:
+                    reject(line, "%s is not a user" % username)
+                    del wanted[username]
+
+            existing = Attendee.objects.filter(event=event,
+                                               user_id__in=user_ids.values())
+            existing = dict(existing.values_list('user_id', 'rsvp_status'))
+            new_attendees = []
+            changes = {}
+            for username, (line, rsvp_status) in wanted.items():
+                user_id = user_ids[username]
+                if user_id not in existing:
+                    new_attendees.append(Attendee(user_id=user_id,
+                                                  event=event,
+                                                  rsvp_status=rsvp_status,
+                                                  rsvped_on=now))
+                elif existing[user_id] != rsvp_status:
+                    changes.setdefault(rsvp_status, []).append(user_id)
+                else:
+                    summary['unchanged'] += 1
+
+            Attendee.objects.bulk_create(new_attendees)
+            summary['created'] += len(new_attendees)
+            for rsvp_status, changed_ids in changes.items():
+                changed = Attendee.objects.filter(event=event,
+                                                  user_id__in=changed_ids)
+                summary['updated'] += changed.update(rsvp_status=rsvp_status,
+                                                     rsvped_on=now)
+
+        event.refresh_rsvp_counts()
+    # The inserts and updates above send no signals
+    pagecache.invalidate(pagecache.events_scope(event.group_id),
+                         pagecache.event_scope(event.pk))
+    summary['errors'].sort(key=lambda error: error['line'])
+    return summary
+
+
+def export_rsvps(event):
+    """ Yields ``(username, rsvp_status, rsvped_on)`` for ``event`` """
+    rows = iterate_in_batches(Attendee.objects.filter(event=event),
+                              'user__username', 'rsvp_status', 'rsvped_on')
+    for username, rsvp_status, rsvped_on in rows:
+        yield username, rsvp_status, rsvped_on.isoformat()
@@ -0,0 +1,116 @@
+"""
+Streaming CSV and iCalendar exports of a group's events and attendees.
+
+Rows are fetched with ``bulk.iterate_in_batches`` and written out one at
+a time, so memory use does not grow with the number of events or RSVPs.
+"""
+from django.core.urlresolvers import reverse
+from django.utils import timezone
+
+from .bulk import iterate_in_batches
+from .models import Event, Attendee
+
+EVENT_FIELDS = ('slug', 'name', 'starts_at', 'ends_at', 'location',
+                'yes_count', 'maybe_count', 'no_count')
+
+ATTENDEE_FIELDS = ('event', 'username', 'rsvp_status', 'rsvped_on')
+
+ICAL_FIELDS = ('group__slug', 'slug', 'pk', 'name', 'description',
+               'starts_at', 'ends_at', 'location')
+
+ICAL_DATETIME = '%Y%m%dT%H%M%SZ'
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else ''
+
+
+def group_events(group):
+    """ Yields a row of ``EVENT_FIELDS`` per visible event of ``group`` """
+    rows = iterate_in_batches(Event.visible_events.filter(group=group),
+                              *EVENT_FIELDS)
+    for slug, name, starts_at, ends_at, location, yes, maybe, no in rows:
+        yield (slug, name, _isoformat(starts_at), _isoformat(ends_at),
+               location or '', yes, maybe, no)
+
+
+def group_attendees(group):
+    """ Yields a row of ``ATTENDEE_FIELDS`` per RSVP to ``group``'s events """
+    rows = iterate_in_batches(Attendee.objects.filter(event__group=group),
+                              'event__slug', 'user__username', 'rsvp_status',
+                              'rsvped_on')
+    for slug, username, rsvp_status, rsvped_on in rows:
+        yield slug, username, rsvp_status, rsvped_on.isoformat()
+
+
+def _ical_datetime(value):
+    """ Formats an aware datetime as an RFC 5545 UTC date-time """
+    return value.astimezone(timezone.utc).strftime(ICAL_DATETIME)
+
+
+def _escape(text):
+    """ Escapes a TEXT value as RFC 5545 requires """
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """
+    Encodes a content line as UTF-8 and folds it into lines of at most
+    75 octets, without splitting a multi-byte character.
+    """
+    encoded = line.encode('utf-8')
+    lines = []
+    while len(encoded) > 75:
+        cut = 75 if not lines else 74
+        while cut and (ord(encoded[cut]) & 0xC0) == 0x80:
+            cut -= 1
+        lines.append(encoded[:cut])
+        encoded = encoded[cut:]
+    lines.append(encoded)
+    return '\r\n '.join(lines) + '\r\n'
+
+
+def ical(events, domain):
+    """
+    Yields an iCalendar document, line by line, with a VEVENT per item
+    of ``events``: ``(group slug, slug, pk, name, description,
+    starts_at, ends_at, location)`` rows. Events without a start are
+    left out, as a VEVENT needs one.
+    """
+    stamp = _ical_datetime(timezone.now())
+    yield _fold(u'BEGIN:VCALENDAR')
+    yield _fold(u'VERSION:2.0')
+    yield _fold(u'PRODID:-//OpenTavern//Events//EN')
+    for (group_slug, slug, pk, name, description, starts_at, ends_at,
+         location) in events:
+        if starts_at is None:
+            continue
+        url = reverse('tavern_event_details',
+                      kwargs={'group': group_slug, 'slug': slug})
+        yield _fold(u'BEGIN:VEVENT')
+        yield _fold(u'UID:event-%s@%s' % (pk, domain))
+        yield _fold(u'DTSTAMP:%s' % stamp)
+        yield _fold(u'DTSTART:%s' % _ical_datetime(starts_at))
+        if ends_at is not None:
+            yield _fold(u'DTEND:%s' % _ical_datetime(ends_at))
+        yield _fold(u'SUMMARY:%s' % _escape(name))
+        yield _fold(u'DESCRIPTION:%s' % _escape(description))
+        if location:
+            yield _fold(u'LOCATION:%s' % _escape(location))
+        yield _fold(u'URL:http://%s%s' % (domain, url))
+        yield _fold(u'END:VEVENT')
+    yield _fold(u'END:VCALENDAR')
+
+
+def group_ical(group, domain):
+    """ iCalendar document of the visible events of ``group`` """
+    return ical(iterate_in_batches(Event.visible_events.filter(group=group),
+                                   *ICAL_FIELDS), domain)
+
+
+def event_ical(event, domain):
+    """ iCalendar document of ``event`` alone """
+    return ical([(event.group.slug, event.slug, event.pk, event.name,
+                  event.description, event.starts_at, event.ends_at,
+                  event.location)], domain)
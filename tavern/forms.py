@@ -1,7 +1,6 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from django.forms.widgets import HiddenInput
 
 from bootstrap3_datetime.widgets import DateTimePicker
 
@@ -67,36 +66,53 @@ class UserCreateForm(UserCreationForm):
         return user
 
 
+def split_usernames(value):
+    """ Distinct usernames of a comma separated list, in order """
+    usernames = []
+    for username in value.split(','):
+        username = username.strip()
+        if username and username not in usernames:
+            usernames.append(username)
+    return usernames
+
+
 class AddOrganizerForm(forms.Form):
+    """ Comma separated usernames, resolved in one query """
     usernames = forms.CharField()
 
+    def __init__(self, *args, **kwargs):
+        self.group = kwargs.pop('group', None)
+        super(AddOrganizerForm, self).__init__(*args, **kwargs)
+
     def clean(self):
         cleaned_data = super(AddOrganizerForm, self).clean()
-        usernames = cleaned_data.get('usernames')
-        cleaned_data['users'] = []
-        for username in usernames.split(','):
-            try:
-                user = User.objects.get(username=username.strip())
-                cleaned_data['users'].append(user)
-            except User.DoesNotExist:
-                raise forms.ValidationError("%s is not a user" % username.strip())
+        if 'usernames' not in cleaned_data:
+            return cleaned_data
+        usernames = split_usernames(cleaned_data['usernames'])
+        if not usernames:
+            raise forms.ValidationError("Enter at least one username")
+        users = dict((user.username, user) for user in
+                     User.objects.filter(username__in=usernames))
+        missing = [username for username in usernames
+                   if username not in users]
+        if missing:
+            raise forms.ValidationError("%s is not a user" % ", ".join(missing))
+        cleaned_data['users'] = [users[username] for username in usernames]
         return cleaned_data
 
 
 class RemoveOrganizerForm(AddOrganizerForm):
-    group = forms.CharField(max_length=5)
-
-    def __init__(self, *args, **kwargs):
-        super(RemoveOrganizerForm, self).__init__(*args, **kwargs)
-        self.fields['group'].widget = HiddenInput()
+    """ Usernames of organizers of ``group``, checked in one more query """
 
     def clean(self):
         cleaned_data = super(RemoveOrganizerForm, self).clean()
         users = cleaned_data.get('users')
-        group = TavernGroup.objects.get(pk=cleaned_data['group'])
-        for user in users:
-            try:
-                group.organizers.get(username=user.username)
-            except User.DoesNotExist:
-                raise forms.ValidationError("%s is not an organizer of %s group" % (user.username, group.name))
+        if not users:
+            return cleaned_data
+        organizer_ids = set(self.group.organizers.filter(
+            pk__in=[user.pk for user in users]).values_list('pk', flat=True))
+        strangers = [user.username for user in users
+                     if user.pk not in organizer_ids]
+        if strangers:
+            raise forms.ValidationError("%s is not an organizer of %s group" % (", ".join(strangers), self.group.name))
         return cleaned_data
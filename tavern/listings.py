@@ -0,0 +1,164 @@
+"""
+Cached listings of upcoming and past events, site-wide or for a group.
+
+Cache keys carry a version per scope, which ``invalidate`` bumps when an
+event or group changes, so stale listings are never looked up again and
+simply expire. A listing also expires when its first upcoming event
+starts, as that event then moves to the past listing.
+
+Listings beyond the first page are read with ``more_events``, which
+pages by ``(starts_at, pk)`` keyset rather than by offset, so every page
+costs the same whichever page it is.
+"""
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Event
+
+SITE_WIDE = 'all'
+
+VERSION_KEY = 'tavern:events:version:%s'
+
+LISTING_KEY = 'tavern:events:%s:%s'
+
+
+def _scope(group_id):
+    return SITE_WIDE if group_id is None else group_id
+
+
+def _new_version():
+    # Not a counter starting at 1: if a version is evicted, restarting it
+    # at 1 would bring back listings cached under the old version 1.
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    """ The version stored under ``key``, started if there is none """
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_version(key):
+    """ Changes the version stored under ``key`` """
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def _version(scope):
+    return get_version(VERSION_KEY % scope)
+
+
+def invalidate(group_id):
+    """ Drops the site-wide listings and those of the group ``group_id`` """
+    for scope in (SITE_WIDE, group_id):
+        bump_version(VERSION_KEY % scope)
+
+
+def _events(group_id, when):
+    """
+    Visible events, site-wide or of the group ``group_id``, which are
+    upcoming or past according to ``when``, in listing order.
+    """
+    events = Event.visible_events.select_related('group')
+    if group_id is not None:
+        events = events.filter(group_id=group_id)
+    if when == 'upcoming':
+        return events.filter(starts_at__gte=timezone.now()).order_by(
+            'starts_at', 'pk')
+    return events.filter(starts_at__lte=timezone.now()).order_by(
+        '-starts_at', '-pk')
+
+
+def _fetch(group_id):
+    limit = settings.TAVERN_EVENTS_LIMIT
+    return {'upcoming': list(_events(group_id, 'upcoming')[:limit]),
+            'past': list(_events(group_id, 'past')[:limit])}
+
+
+def get_listings(group_id=None):
+    """
+    Upcoming and past events, at most ``TAVERN_EVENTS_LIMIT`` of each,
+    of the whole site or of the group ``group_id``. Upcoming events come
+    soonest first and past ones latest first.
+    """
+    scope = _scope(group_id)
+    key = LISTING_KEY % (scope, _version(scope))
+    listings = cache.get(key)
+    if listings is None:
+        listings = _fetch(group_id)
+        timeout = settings.TAVERN_EVENTS_CACHE_TIMEOUT
+        if listings['upcoming']:
+            starts_in = listings['upcoming'][0].starts_at - timezone.now()
+            timeout = max(1, min(timeout, int(starts_in.total_seconds())))
+        cache.set(key, listings, timeout)
+    return listings
+
+
+def upcoming_events(group_id=None):
+    return get_listings(group_id)['upcoming']
+
+
+def past_events(group_id=None):
+    return get_listings(group_id)['past']
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def make_cursor(when, pk):
+    """ Opaque position of the row ``pk`` at time ``when`` in a listing """
+    delta = when - EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 10 ** 6 + \
+        delta.microseconds
+    return '%s-%s' % (microseconds, pk)
+
+
+def cursor(event):
+    """ Opaque position of ``event`` in a listing, for ``more_events`` """
+    return make_cursor(event.starts_at, event.pk)
+
+
+def parse_cursor(value):
+    """
+    ``(when, pk)`` of a cursor made by ``make_cursor``. Raises
+    ValueError if ``value`` is not one.
+    """
+    microseconds, pk = value.rsplit('-', 1)
+    return EPOCH + timedelta(microseconds=int(microseconds)), int(pk)
+
+
+def next_cursor(events):
+    """
+    Cursor of the page following ``events``, or None when a short page
+    shows there are no more. A full last page costs one empty fetch.
+    """
+    if len(events) < settings.TAVERN_EVENTS_LIMIT:
+        return None
+    return cursor(events[-1])
+
+
+def more_events(group_id, when, after):
+    """
+    The page of ``when`` ('upcoming' or 'past') events, site-wide or of
+    the group ``group_id``, following the cursor ``after``.
+    """
+    starts_at, pk = parse_cursor(after)
+    events = _events(group_id, when)
+    if when == 'upcoming':
+        events = events.filter(Q(starts_at__gt=starts_at) |
+                               Q(starts_at=starts_at, pk__gt=pk))
+    else:
+        events = events.filter(Q(starts_at__lt=starts_at) |
+                               Q(starts_at=starts_at, pk__lt=pk))
+    return list(events[:settings.TAVERN_EVENTS_LIMIT])
@@ -0,0 +1,124 @@
+"""
+Request-scoped loading of the groups and RSVPs of the current user.
+
+Views and template tags ask ``loader_for(request)`` instead of querying,
+so data several of them need on one page is fetched once.
+"""
+from django.utils.functional import cached_property
+
+from .models import TavernGroup, Membership, Attendee, get_rsvp_yes_events
+
+
+class TavernLoader(object):
+    """ Groups and RSVPs of ``user``, each fetched on first use """
+
+    def __init__(self, user):
+        self.user = user
+        self._rsvp_yes_events = {}
+        self._rsvp_statuses = {}
+        self._wanted_statuses = set()
+        self._memberships = {}
+
+    @cached_property
+    def joined_group_ids(self):
+        if not self.user.is_authenticated():
+            return frozenset()
+        return frozenset(Membership.objects.filter(user=self.user)
+                         .values_list('tavern_group_id', flat=True))
+
+    @cached_property
+    def all_groups(self):
+        """ Every group: a lazy queryset, which templates may slice """
+        return TavernGroup.objects.all()
+
+    @cached_property
+    def joined_groups(self):
+        if not self.joined_group_ids:
+            return []
+        return list(TavernGroup.objects.filter(pk__in=self.joined_group_ids))
+
+    @cached_property
+    def unjoined_groups(self):
+        """ The groups not joined, by name: a lazy queryset """
+        groups = TavernGroup.objects.order_by('name')
+        if self.user.is_authenticated():
+            groups = groups.exclude(pk__in=Membership.objects.filter(
+                user=self.user).values('tavern_group'))
+        return groups
+
+    def rsvp_yes_events(self, limit=None):
+        """
+        Events the user said yes to, upcoming first: a lazy queryset, or
+        a list of the first ``limit`` of them
+        """
+        if limit not in self._rsvp_yes_events:
+            events = get_rsvp_yes_events(self.user)
+            if limit is not None:
+                events = list(events[:limit])
+            self._rsvp_yes_events[limit] = events
+        return self._rsvp_yes_events[limit]
+
+    def want_rsvp_statuses(self, events):
+        """
+        Notes that the user's RSVPs to ``events`` will be asked for, so
+        the first ``rsvp_status`` fetches them all in one query
+        """
+        self._want_rsvp_statuses(event.pk for event in events)
+
+    def _want_rsvp_statuses(self, event_ids):
+        self._wanted_statuses.update(event_id for event_id in event_ids
+                                     if event_id not in self._rsvp_statuses)
+
+    def _load_rsvp_statuses(self):
+        wanted, self._wanted_statuses = self._wanted_statuses, set()
+        if not wanted:
+            return
+        self._rsvp_statuses.update(dict.fromkeys(wanted))
+        if self.user.is_authenticated():
+            self._rsvp_statuses.update(Attendee.objects.filter(
+                user=self.user, event__in=wanted).values_list(
+                'event', 'rsvp_status'))
+
+    def rsvp_statuses(self, event_ids):
+        """ The user's RSVP status to each of the events ``event_ids`` """
+        self._want_rsvp_statuses(event_ids)
+        self._load_rsvp_statuses()
+        return dict((event_id, self._rsvp_statuses[event_id])
+                    for event_id in event_ids)
+
+    def rsvp_status(self, event):
+        """ The user's RSVP status to ``event``, None if they haven't """
+        return self.rsvp_statuses([event.pk])[event.pk]
+
+    def is_member(self, group):
+        """
+        Whether the user is a member of ``group``: from the user's
+        memberships if they are loaded already, else one indexed lookup
+        """
+        if 'joined_group_ids' in self.__dict__:
+            return group.pk in self.joined_group_ids
+        if group.pk not in self._memberships:
+            self._memberships[group.pk] = (
+                self.user.is_authenticated() and
+                Membership.objects.filter(user=self.user,
+                                          tavern_group=group).exists())
+        return self._memberships[group.pk]
+
+
+def loader_for(request):
+    """ The loader of ``request``, created on first use """
+    loader = getattr(request, '_tavern_loader', None)
+    if loader is None:
+        loader = request._tavern_loader = TavernLoader(request.user)
+    return loader
+
+
+def loader_for_user(context, user):
+    """
+    Loader for ``user`` in a template ``context``: the request's own if
+    ``user`` is the one making the request, else a new one.
+    """
+    request = context.get('request')
+    if request is not None and getattr(request, 'user', None) == user:
+        return loader_for(request)
+    return TavernLoader(user)
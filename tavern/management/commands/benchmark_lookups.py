@@ -0,0 +1,66 @@
+import json
+from optparse import make_option
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from south.management.commands import patch_for_test_db_setup
+
+from tavern import benchmark
+
+# Last migration without the indexes for the hot lookups
+BEFORE_MIGRATION = '0017'
+
+
+class Command(BaseCommand):
+    help = ("Seeds a throwaway test database with a synthetic dataset and "
+            "times the hot lookups before and after the migrations adding "
+            "their indexes.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--groups', type='int', default=2000,
+                    help='Number of groups to create'),
+        make_option('--events', type='int', default=10,
+                    help='Number of events per group'),
+        make_option('--members', type='int', default=50,
+                    help='Number of members per group'),
+        make_option('--attendees', type='int', default=50,
+                    help='Number of attendees per event'),
+        make_option('--repeat', type='int', default=5,
+                    help='Times each lookup is run, the best one counts'),
+        make_option('--report', default=None,
+                    help='Write a JSON report to this file'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        dataset = dict((key, options[key])
+                       for key in ('groups', 'events', 'members', 'attendees'))
+
+        patch_for_test_db_setup()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=verbosity,
+                                           autoclobber=True)
+        try:
+            # Seeded with the current models, whose tables later
+            # migrations add, then taken back to before the indexes
+            fixtures = benchmark.seed(**dataset)
+            call_command('migrate', 'tavern', BEFORE_MIGRATION,
+                         verbosity=verbosity)
+            before = benchmark.time_lookups(fixtures, options['repeat'])
+            call_command('migrate', 'tavern', verbosity=verbosity)
+            after = benchmark.time_lookups(fixtures, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+        self.stdout.write('%-30s %12s %12s' % ('lookup', 'before', 'after'))
+        for old, new in zip(before, after):
+            self.stdout.write('%-30s %11.6fs %11.6fs' % (
+                old['name'], old['seconds'], new['seconds']))
+
+        if options['report']:
+            with open(options['report'], 'w') as report:
+                json.dump({'dataset': dataset,
+                           'before': before,
+                           'after': after},
+                          report, indent=2, sort_keys=True)
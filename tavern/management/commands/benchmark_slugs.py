@@ -0,0 +1,41 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from south.management.commands import patch_for_test_db_setup
+
+from tavern import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Creates many events whose slugs collide in a throwaway test "
+            "database and reports what each save costs.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', type='int', default=500,
+                    help='Number of colliding events to create'),
+        make_option('--sample', type='int', default=50,
+                    help='Number of last saves to average'),
+        make_option('--report', default=None,
+                    help='Write a JSON report to this file'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        patch_for_test_db_setup()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=verbosity,
+                                           autoclobber=True)
+        try:
+            result = benchmark.time_slug_collisions(options['count'],
+                                                    options['sample'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+        self.stdout.write('%(count)s events, last slug %(last_slug)s: '
+                          '%(queries_per_save).1f queries and '
+                          '%(seconds_per_save).6fs per save' % result)
+        if options['report']:
+            with open(options['report'], 'w') as report:
+                json.dump(result, report, indent=2, sort_keys=True)
@@ -0,0 +1,57 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from south.management.commands import patch_for_test_db_setup
+
+from tavern import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Seeds a throwaway test database with a synthetic dataset, "
+            "requests every named URL and checks query and time budgets.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--groups', type='int', default=1000,
+                    help='Number of groups to create'),
+        make_option('--events', type='int', default=10,
+                    help='Number of events per group'),
+        make_option('--members', type='int', default=50,
+                    help='Number of members per group'),
+        make_option('--attendees', type='int', default=50,
+                    help='Number of attendees per event'),
+        make_option('--report', default=None,
+                    help='Write a JSON report to this file'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        dataset = dict((key, options[key])
+                       for key in ('groups', 'events', 'members', 'attendees'))
+
+        patch_for_test_db_setup()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=verbosity,
+                                           autoclobber=True)
+        try:
+            fixtures = benchmark.seed(**dataset)
+            results = benchmark.run(fixtures)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+        failures = [result for result in results if not result['ok']]
+        for result in results:
+            self.stdout.write('%(name)-40s %(queries)3s/%(max_queries)-3s '
+                              'queries %(seconds)8.4fs  %(status)s' % result)
+
+        if options['report']:
+            with open(options['report'], 'w') as report:
+                json.dump({'dataset': dataset,
+                           'results': results,
+                           'failures': len(failures)},
+                          report, indent=2, sort_keys=True)
+
+        if failures:
+            raise CommandError('%s URL(s) over budget: %s' % (
+                len(failures), ', '.join(r['name'] for r in failures)))
@@ -0,0 +1,13 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from tavern import search
+
+
+class Command(NoArgsCommand):
+    help = ("Indexes every group and event for search again, as needed "
+            "for those saved before search was added.")
+
+    def handle_noargs(self, **options):
+        with transaction.atomic():
+            search.rebuild()
@@ -0,0 +1,15 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from tavern import pagecache
+from tavern.models import recount_counters
+
+
+class Command(NoArgsCommand):
+    help = ("Recomputes the stored RSVP counts of every event and the "
+            "member count of every group.")
+
+    def handle_noargs(self, **options):
+        with transaction.atomic():
+            recount_counters()
+        pagecache.invalidate_all()
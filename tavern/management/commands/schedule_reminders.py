@@ -0,0 +1,13 @@
+from django.core.management.base import NoArgsCommand
+
+from tavern.reminders import schedule_reminders
+
+
+class Command(NoArgsCommand):
+    help = ("Queues reminders of the events starting soon which haven't "
+            "been reminded of yet. Meant to run every minute.")
+
+    def handle_noargs(self, **options):
+        count = schedule_reminders()
+        if int(options['verbosity']) > 0:
+            self.stdout.write('Queued reminders of %s events' % count)
@@ -0,0 +1,38 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from tavern.notifications import deliver_pending
+
+
+class Command(BaseCommand):
+    help = ("Delivers the pending RSVP and membership notifications, in "
+            "batches, once or until interrupted.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=None,
+                    help='Notifications delivered per batch'),
+        make_option('--threads', type='int', default=None,
+                    help='Threads delivering a batch'),
+        make_option('--loop', action='store_true', default=False,
+                    help='Keep polling for new notifications'),
+        make_option('--interval', type='float', default=5,
+                    help='Seconds to wait when there is nothing to send'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        total = 0
+        while True:
+            handled = deliver_pending(options['batch_size'],
+                                      options['threads'])
+            total += handled
+            if handled and verbosity > 1:
+                self.stdout.write('Handled %s notifications' % handled)
+            if not handled:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        if verbosity > 0:
+            self.stdout.write('Handled %s notifications' % total)
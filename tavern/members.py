@@ -0,0 +1,47 @@
+"""
+Member directory of a group, latest to join first.
+
+Pages follow each other by ``(join_date, pk)`` keyset rather than by
+offset, on the ``(tavern_group, join_date, id)`` index, so every page of
+a group's members costs one indexed query however many members it has.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from .listings import make_cursor, parse_cursor
+from .models import Membership
+
+
+def _members(group_id):
+    return Membership.objects.filter(tavern_group_id=group_id) \
+        .select_related('user').order_by('-join_date', '-pk')
+
+
+def recent_members(group_id, limit=5):
+    """ The last ``limit`` members to join the group ``group_id`` """
+    return list(_members(group_id)[:limit])
+
+
+def cursor(membership):
+    return make_cursor(membership.join_date, membership.pk)
+
+
+def members_page(group_id, after=None):
+    """
+    ``TAVERN_MEMBERS_PER_PAGE`` members of the group ``group_id``,
+    following the cursor ``after`` if given. Raises ValueError if
+    ``after`` is not a cursor.
+    """
+    members = _members(group_id)
+    if after:
+        join_date, pk = parse_cursor(after)
+        members = members.filter(Q(join_date__lt=join_date) |
+                                 Q(join_date=join_date, pk__lt=pk))
+    return list(members[:settings.TAVERN_MEMBERS_PER_PAGE])
+
+
+def next_cursor(members):
+    """ Cursor of the page after ``members``, None when it was the last """
+    if len(members) < settings.TAVERN_MEMBERS_PER_PAGE:
+        return None
+    return cursor(members[-1])
@@ -1,11 +1,11 @@
 # pylint: disable=method-hidden
-from django.db import models
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models import F, Count
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.urlresolvers import reverse
-from django.template.defaultfilters import slugify
 
-from .slugify import unique_slugify
+from .slugify import save_with_unique_slug
 
 
 class TavernGroupManager(models.Manager):
@@ -16,6 +16,32 @@ class TavernGroupManager(models.Manager):
         """
         return super(TavernGroupManager, self).all().exclude(members=None)
 
+    def by_name(self, after=None, member=None):
+        """
+        Groups in name order, only those named after ``after`` if given,
+        and only those ``member`` joined if given. Pages are taken by
+        name keyset on the unique name index, so every page costs the
+        same however many groups there are.
+        """
+        groups = self.get_queryset().order_by('name')
+        if after:
+            groups = groups.filter(name__gt=after)
+        if member is not None:
+            groups = groups.filter(memberships__user=member)
+        return groups
+
+    def with_membership(self, groups, user):
+        """
+        Sets ``is_member`` for ``user`` on each of ``groups``, a page of
+        them, with one query on the ``(user, tavern_group)`` index.
+        """
+        member_of = set(Membership.objects.filter(
+            user=user, tavern_group__in=[group.pk for group in groups])
+            .values_list('tavern_group', flat=True))
+        for group in groups:
+            group.is_member = group.pk in member_of
+        return groups
+
 
 class TavernGroup(models.Model):
     "Similar interests group, create events for these"
@@ -33,20 +59,36 @@ class TavernGroup(models.Model):
     members = models.ManyToManyField(User,
                                      through="Membership",
                                      related_name="tavern_groups")
-    slug = models.SlugField(max_length=50)
+    slug = models.SlugField(max_length=50, unique=True)
+    member_count = models.PositiveIntegerField(default=0, editable=False)
+    # Also touched by membership and organizer changes
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = TavernGroupManager()
 
     def get_absolute_url(self):
         return reverse("tavern_group_details", kwargs={"slug": self.slug})
 
+    def update_member_count(self, delta):
+        """
+        Adds ``delta`` to the stored member count. Call it in the
+        transaction which adds or removes the Membership.
+        """
+        self.updated_at = timezone.now()
+        TavernGroup.objects.filter(pk=self.pk).update(
+            member_count=F('member_count') + delta, updated_at=self.updated_at)
+        self.member_count += delta
+
     def save(self, *args, **kwargs):
-        self.slug = slugify(self.name)
-        super(TavernGroup, self).save(*args, **kwargs)
-        Membership.objects.get_or_create(
+        save_with_unique_slug(
+            self, self.name,
+            lambda: super(TavernGroup, self).save(*args, **kwargs))
+        membership, created = Membership.objects.get_or_create(
             user=self.creator,
             tavern_group=self,
             defaults={'join_date': timezone.now()})
+        if created:
+            self.update_member_count(1)
 
     def __unicode__(self):
         return "%s" % self.name
@@ -62,6 +104,7 @@ class Membership(models.Model):
 
     class Meta:
         unique_together = ['user', 'tavern_group']
+        index_together = [['tavern_group', 'join_date', 'id']]
 
     def get_name(self):
         return self.user.get_full_name() or self.user.username
@@ -99,11 +142,22 @@ class Event(models.Model):
     creator = models.ForeignKey(User)
     show = models.BooleanField(default=True)
 
+    yes_count = models.PositiveIntegerField(default=0, editable=False)
+    no_count = models.PositiveIntegerField(default=0, editable=False)
+    maybe_count = models.PositiveIntegerField(default=0, editable=False)
+    # Also touched by RSVP changes
+    updated_at = models.DateTimeField(auto_now=True)
+
     objects = models.Manager()
     visible_events = EventShowManager()
 
     class Meta:
         ordering = ['starts_at']
+        unique_together = [['group', 'name'], ['group', 'slug']]
+        # Event listings filter on show (and group), sort on starts_at;
+        # reminders look for events changed since their last run
+        index_together = [['group', 'show', 'starts_at'],
+                          ['show', 'starts_at'], ['show', 'updated_at']]
 
     def get_creator(self):
         return self.creator.get_full_name() or self.creator.username
@@ -112,22 +166,128 @@ class Event(models.Model):
         return reverse("tavern_event_details", kwargs={"slug": self.slug,
                                                        "group": self.group.slug})
 
+    def update_rsvp_counts(self, old_status=None, new_status=None):
+        """
+        Moves one RSVP from ``old_status`` to ``new_status`` in the stored
+        counters; leave ``old_status`` out for a new RSVP and
+        ``new_status`` out for a removed one. Call it in the transaction
+        which changes the Attendee.
+        """
+        if old_status == new_status:
+            return
+        self.updated_at = timezone.now()
+        changes = {'updated_at': self.updated_at}
+        for status, delta in ((old_status, -1), (new_status, 1)):
+            if status:
+                field = '%s_count' % status
+                changes[field] = F(field) + delta
+                setattr(self, field, getattr(self, field) + delta)
+        Event.objects.filter(pk=self.pk).update(**changes)
+
+    def refresh_rsvp_counts(self):
+        """ Recomputes the stored RSVP counters from the Attendee table """
+        counts = dict(self.attendee_set.values_list('rsvp_status').annotate(
+            Count('pk')).order_by())
+        self.updated_at = timezone.now()
+        changes = {'updated_at': self.updated_at}
+        for status, label in Attendee.RSVP_CHOICES:
+            field = '%s_count' % status
+            changes[field] = counts.get(status, 0)
+            setattr(self, field, changes[field])
+        Event.objects.filter(pk=self.pk).update(**changes)
+
+    def is_over(self, now=None):
+        """ Whether the event has ended, or started if it has no end """
+        ends_at = self.ends_at or self.starts_at
+        return ends_at is not None and (now or timezone.now()) > ends_at
+
     def save(self, *args, **kwargs):
         # This event's slug should not match a slug of any
         # existing event in the same group.
         slug_queryset = self.group.event_set.all()
-        unique_slugify(self, self.name, queryset=slug_queryset)
-        super(Event, self).save(*args, **kwargs)
-        Attendee.objects.get_or_create(
+        save_with_unique_slug(
+            self, self.name, lambda: super(Event, self).save(*args, **kwargs),
+            queryset=slug_queryset)
+        attendee, created = Attendee.objects.get_or_create(
             user=self.creator,
             event=self,
             defaults={'rsvped_on': timezone.now(),
                       'rsvp_status': 'yes'})
+        if created:
+            self.update_rsvp_counts(new_status=attendee.rsvp_status)
 
     def __unicode__(self):
         return "%s" % self.name
 
 
+RSVP_MESSAGES = {
+    ('yes', False): "You are attending this event.",
+    ('yes', True): "You have attended this event.",
+    ('no', False): "You are not attending this event.",
+    ('maybe', False): "You may attend this event.",
+    (None, False): "You have not rsvped",
+    (None, True): "You did not rsvp",
+}
+
+
+def rsvp_message(rsvp_status, is_over):
+    """ Message for an RSVP of ``rsvp_status``, None for no RSVP """
+    return RSVP_MESSAGES.get((rsvp_status, is_over),
+                             "You did not attend this event.")
+
+
+class AttendeeManager(models.Manager):
+
+    def with_rsvp_messages(self, now=None):
+        """
+        Attendees whose ``get_rsvp`` needs no event loaded: whether their
+        event is over, as of one ``now`` for all of them, is selected
+        along with them
+        """
+        ends_at = ('(SELECT COALESCE(tavern_event.ends_at, tavern_event.starts_at)'
+                   ' FROM tavern_event WHERE tavern_event.id = tavern_attendee.event_id)')
+        return self.get_queryset().extra(
+            select={'event_is_over': 'CASE WHEN %s < %%s THEN 1 ELSE 0 END' % ends_at},
+            select_params=(now or timezone.now(),))
+
+    def set_rsvp(self, user, event_id, rsvp_status):
+        """
+        Creates or updates the RSVP of ``user`` to an event and keeps the
+        event's counters in step, in one transaction. The event row is
+        locked first so concurrent RSVPs to it are serialized and the
+        returned attendee's ``event`` carries exact counts; the unique
+        (user, event) constraint catches two first RSVPs racing on
+        databases which don't lock rows. A changed RSVP is queued for
+        notifying the group's organizers in the same transaction.
+        """
+        with transaction.atomic():
+            event = Event.objects.select_for_update().get(pk=event_id)
+            now = timezone.now()
+            attendee = self.filter(user=user, event=event).first()
+            if attendee is None:
+                try:
+                    with transaction.atomic():
+                        attendee = self.create(user=user,
+                                               event=event,
+                                               rsvp_status=rsvp_status,
+                                               rsvped_on=now)
+                    event.update_rsvp_counts(new_status=rsvp_status)
+                    Notification.objects.rsvp(user, event, rsvp_status)
+                    return attendee
+                except IntegrityError:
+                    # Created by a concurrent request since the lookup
+                    attendee = self.get(user=user, event=event)
+            old_status = attendee.rsvp_status
+            attendee.event = event
+            attendee.rsvp_status = rsvp_status
+            attendee.rsvped_on = now
+            attendee.save(update_fields=['rsvp_status', 'rsvped_on'])
+            event.update_rsvp_counts(old_status, rsvp_status)
+            if old_status != rsvp_status:
+                Notification.objects.rsvp(user, event, rsvp_status)
+        return attendee
+
+
 class Attendee(models.Model):
     "People who have RSVPed to events"
     RSVP_CHOICES = (('yes', 'Yes'), ('no', 'No'), ('maybe', 'May Be'))
@@ -139,26 +299,143 @@ class Attendee(models.Model):
                                    max_length=5,
                                    default="yes")
 
+    objects = AttendeeManager()
+
+    class Meta:
+        unique_together = ['user', 'event']
+        index_together = [['event', 'rsvp_status'], ['user', 'rsvp_status']]
+
     def get_name(self):
         return self.user.get_full_name() or self.user.username
 
-    def get_rsvp(self):
-        if self.rsvp_status == "yes" and timezone.now() <= self.event.ends_at:
-            return "You are attending this event."
-        elif self.rsvp_status == "yes" and timezone.now() > self.event.ends_at:
-            return "You have attended this event."
-        elif self.rsvp_status == "no" and timezone.now() <= self.event.ends_at:
-            return "You are not attending this event."
-        elif self.rsvp_status == "maybe" and timezone.now() <= self.event.ends_at:
-            return "You may attend this event."
-        else:
-            return "You did not attend this event."
+    def get_rsvp(self, now=None):
+        """
+        Message telling the user where their RSVP stands. Uses the
+        ``event_is_over`` of ``with_rsvp_messages`` if there is one, so
+        the event isn't loaded.
+        """
+        is_over = getattr(self, 'event_is_over', None)
+        if is_over is None:
+            is_over = self.event.is_over(now)
+        return rsvp_message(self.rsvp_status, bool(is_over))
 
     def __unicode__(self):
         return "%s - %s - %s" % (self.user.first_name, self.event.name,
                                  self.rsvp_status)
 
 
+class NotificationManager(models.Manager):
+
+    def rsvp(self, user, event, rsvp_status):
+        return self.create(kind='rsvp', user=user, group_id=event.group_id,
+                           event=event, rsvp_status=rsvp_status)
+
+    def rsvp_removed(self, attendee):
+        """ Queues the removal of ``attendee``, as an RSVP with no status """
+        return self.create(kind='rsvp', user_id=attendee.user_id,
+                           group_id=attendee.event.group_id,
+                           event_id=attendee.event_id)
+
+    def membership(self, user, group, joined):
+        return self.create(kind='joined' if joined else 'left', user=user,
+                           group=group)
+
+    def reminders(self, events):
+        """
+        Queues a reminder of each of ``events`` not yet reminded of at its
+        current start, in at most three queries. A pending reminder of an
+        earlier start is dropped, so moving an event before its reminder
+        went out doesn't remind of it twice. Returns the new reminders.
+        """
+        events = dict((event.pk, event) for event in events)
+        reminded = set()
+        stale = []
+        for pk, event_id, starts_at, sent_at in self.filter(
+                kind='reminder', event__in=events.keys()).values_list(
+                'pk', 'event', 'starts_at', 'sent_at'):
+            if starts_at == events[event_id].starts_at:
+                reminded.add(event_id)
+            elif sent_at is None:
+                stale.append(pk)
+        if stale:
+            self.filter(pk__in=stale).delete()
+        new = [self.model(kind='reminder', user_id=event.creator_id,
+                          group_id=event.group_id, event=event,
+                          starts_at=event.starts_at)
+               for pk, event in events.items() if pk not in reminded]
+        return self.bulk_create(new)
+
+    def pending(self, now=None):
+        """ Notifications due for delivery by ``now``, oldest due first """
+        return self.get_queryset().filter(
+            retry_at__lte=now or timezone.now()).order_by('retry_at', 'pk')
+
+
+class Notification(models.Model):
+    """
+    Outbox of changes to tell a group's organizers about, and of event
+    reminders to its attendees, written in the transaction making the
+    change and delivered later by the ``send_notifications`` command, so
+    requests never wait on mail.
+    """
+    KIND_CHOICES = (('rsvp', 'RSVP'), ('joined', 'Joined'), ('left', 'Left'),
+                    ('reminder', 'Reminder'))
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    user = models.ForeignKey(User, related_name='+')
+    group = models.ForeignKey(TavernGroup, related_name='+')
+    event = models.ForeignKey(Event, null=True, blank=True, related_name='+')
+    rsvp_status = models.CharField(max_length=5, blank=True)
+    # Start of the event a reminder is of, so each start is reminded once
+    starts_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # When delivery is next due: later while a worker has the notification
+    # claimed or after a failure, None once it is sent or out of attempts
+    retry_at = models.DateTimeField(null=True, blank=True,
+                                    default=timezone.now)
+
+    objects = NotificationManager()
+
+    class Meta:
+        unique_together = [['event', 'starts_at']]
+        index_together = [['retry_at', 'id']]
+
+    def __unicode__(self):
+        return "%s - %s - %s" % (self.kind, self.user_id, self.group_id)
+
+
+class Watermark(models.Model):
+    """
+    How far a scheduled job has got, so each run carries on from the
+    last one instead of scanning everything again.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.DateTimeField()
+
+    def __unicode__(self):
+        return "%s - %s" % (self.name, self.value)
+
+
+def recount_counters():
+    """
+    Recomputes the stored RSVP and member counters from the Attendee and
+    Membership tables, fixing any drift (e.g. from admin edits or bulk
+    deletes).
+    """
+    cursor = connection.cursor()
+    for status, label in Attendee.RSVP_CHOICES:
+        cursor.execute(
+            'UPDATE tavern_event SET %s_count = ('
+            'SELECT COUNT(*) FROM tavern_attendee '
+            'WHERE tavern_attendee.event_id = tavern_event.id '
+            'AND tavern_attendee.rsvp_status = %%s)' % status, [status])
+    cursor.execute(
+        'UPDATE tavern_taverngroup SET member_count = ('
+        'SELECT COUNT(*) FROM tavern_membership '
+        'WHERE tavern_membership.tavern_group_id = tavern_taverngroup.id)')
+
+
 def get_unjoined_groups(user):
     user_unjoined_groups = TavernGroup.objects.exclude(members=user)
     return user_unjoined_groups
@@ -170,6 +447,19 @@ def get_groups(user):
 
 
 def get_rsvp_yes_events(user):
-    rsvp_yes_events = user.attendee_set.filter(rsvp_status='yes')
-    events = [attendee.event for attendee in rsvp_yes_events]
-    return events
+    """
+    Lazy queryset of the events ``user`` has said yes to, with their
+    groups. Upcoming events come first, soonest first, then past events,
+    latest first.
+    """
+    # Both selects take the same parameter, so their order doesn't matter
+    now = timezone.now()
+    upcoming = 'tavern_event.starts_at >= %s'
+    events = Event.objects.filter(attendee__user=user,
+                                  attendee__rsvp_status='yes')
+    return events.select_related('group').extra(
+        select={'is_past': 'CASE WHEN %s THEN 0 ELSE 1 END' % upcoming,
+                'upcoming_starts_at': ('CASE WHEN %s THEN tavern_event.starts_at'
+                                       ' END' % upcoming)},
+        select_params=(now, now),
+        order_by=['is_past', 'upcoming_starts_at', '-starts_at'])
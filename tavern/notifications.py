@@ -0,0 +1,183 @@
+"""
+Delivery of the RSVP, membership and reminder notifications queued in
+the ``Notification`` outbox.
+
+Views only write an outbox row, in the transaction making the change, so
+they never wait on mail. ``deliver_pending`` later claims a batch of due
+rows in a short transaction, looks up everything needed to render them
+in a constant number of queries and hands them to the backend named by
+``TAVERN_NOTIFICATION_BACKEND`` from a pool of threads, holding no locks
+while mail is sent. Only the calling thread touches the database.
+"""
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_by_path
+
+from .models import TavernGroup, Event, Attendee, Notification
+
+
+class EmailBackend(object):
+    """
+    Sends notifications with Django's mail, so ``EMAIL_BACKEND`` picks
+    where they go: SMTP, or the console or file backends when testing.
+    Each recipient gets a mail of their own, over one connection, so
+    attendees don't see each other's addresses.
+    """
+
+    def send(self, subject, body, recipients):
+        send_mass_mail([(subject, body, settings.DEFAULT_FROM_EMAIL,
+                         [recipient]) for recipient in recipients])
+
+
+def get_backend():
+    return import_by_path(settings.TAVERN_NOTIFICATION_BACKEND)()
+
+
+def _name(user):
+    return user.get_full_name() or user.username
+
+
+def render(notification, user, group, event):
+    """ Subject and body of ``notification`` """
+    if notification.kind == 'reminder':
+        subject = 'Reminder: %s starts at %s' % (event.name, event.starts_at)
+    elif notification.kind == 'rsvp' and not notification.rsvp_status:
+        subject = '%s removed their RSVP to %s' % (_name(user), event.name)
+    elif notification.kind == 'rsvp':
+        subject = '%s RSVPed %s to %s' % (
+            _name(user), notification.rsvp_status, event.name)
+    elif notification.kind == 'joined':
+        subject = '%s joined %s' % (_name(user), group.name)
+    else:
+        subject = '%s left %s' % (_name(user), group.name)
+    body = '%s\n\nGroup: %s\n' % (subject, group.name)
+    if event is not None:
+        body += 'Event: %s, starting %s\n' % (event.name, event.starts_at)
+        if event.location:
+            body += 'Location: %s\n' % event.location
+    return subject, body
+
+
+def _messages(notifications):
+    """
+    ``(notification, subject, body, recipients)`` of each notification.
+    Changes go to the creator and organizers of the group but for the
+    user who made them, reminders to the users who RSVPed yes or maybe.
+    Costs at most five queries per batch.
+    """
+    group_ids = set(n.group_id for n in notifications)
+    groups = TavernGroup.objects.in_bulk(group_ids)
+    events = Event.objects.in_bulk(
+        set(n.event_id for n in notifications if n.event_id))
+
+    organizers = dict((group_id, set([groups[group_id].creator_id]))
+                      for group_id in group_ids)
+    for group_id, user_id in TavernGroup.organizers.through.objects.filter(
+            taverngroup__in=group_ids).values_list('taverngroup', 'user'):
+        organizers[group_id].add(user_id)
+
+    reminded = set(n.event_id for n in notifications
+                   if n.kind == 'reminder')
+    attendees = dict((event_id, set()) for event_id in reminded)
+    if reminded:
+        for event_id, user_id in Attendee.objects.filter(
+                event__in=reminded, rsvp_status__in=('yes', 'maybe')) \
+                .values_list('event', 'user'):
+            attendees[event_id].add(user_id)
+
+    user_ids = set(n.user_id for n in notifications)
+    for ids in organizers.values() + attendees.values():
+        user_ids.update(ids)
+    users = User.objects.in_bulk(user_ids)
+
+    messages = []
+    for notification in notifications:
+        if notification.kind == 'reminder':
+            recipient_ids = attendees[notification.event_id]
+        else:
+            recipient_ids = organizers[notification.group_id] - \
+                set([notification.user_id])
+        recipients = sorted(users[user_id].email for user_id in recipient_ids
+                            if users[user_id].email)
+        subject, body = render(notification, users[notification.user_id],
+                               groups[notification.group_id],
+                               events.get(notification.event_id))
+        messages.append((notification, subject, body, recipients))
+    return messages
+
+
+def _deliver(backend, message):
+    notification, subject, body, recipients = message
+    if recipients:
+        try:
+            backend.send(subject, body, recipients)
+        except Exception:
+            return False
+    return True
+
+
+def _retry_at(attempts, now):
+    """ When a notification which failed ``attempts`` times is due again """
+    if attempts >= settings.TAVERN_NOTIFICATION_MAX_ATTEMPTS:
+        return None
+    delay = settings.TAVERN_NOTIFICATION_RETRY_DELAY * 2 ** (attempts - 1)
+    return now + timedelta(seconds=delay)
+
+
+def deliver_pending(batch_size=None, threads=None):
+    """
+    Delivers a batch of due notifications. The batch is claimed first,
+    in a transaction of its own: an attempt is counted against each and
+    they are put off by ``TAVERN_NOTIFICATION_CLAIM_TIMEOUT``, so
+    concurrent workers take different ones, and those of a worker which
+    dies are taken again later. Delivered ones are then marked sent, and
+    failed ones retried after ``TAVERN_NOTIFICATION_RETRY_DELAY`` seconds,
+    doubled on each attempt, until out of
+    ``TAVERN_NOTIFICATION_MAX_ATTEMPTS``, when they are left unsent and
+    no longer due. Returns the number of notifications handled.
+    """
+    batch_size = batch_size or settings.TAVERN_NOTIFICATION_BATCH_SIZE
+    threads = threads or settings.TAVERN_NOTIFICATION_THREADS
+    now = timezone.now()
+    with transaction.atomic():
+        notifications = list(
+            Notification.objects.pending(now).select_for_update()
+            [:batch_size])
+        if not notifications:
+            return 0
+        claimed_until = now + timedelta(
+            seconds=settings.TAVERN_NOTIFICATION_CLAIM_TIMEOUT)
+        Notification.objects.filter(pk__in=[n.pk for n in notifications]) \
+            .update(attempts=F('attempts') + 1, retry_at=claimed_until)
+
+    messages = _messages(notifications)
+    backend = get_backend()
+    pool = ThreadPool(min(threads, len(messages)))
+    try:
+        delivered = pool.map(
+            lambda message: _deliver(backend, message), messages)
+    finally:
+        pool.close()
+        pool.join()
+
+    now = timezone.now()
+    sent = [n.pk for n, ok in zip(notifications, delivered) if ok]
+    if sent:
+        Notification.objects.filter(pk__in=sent).update(sent_at=now,
+                                                        retry_at=None)
+    failed = {}
+    for notification, ok in zip(notifications, delivered):
+        if not ok:
+            failed.setdefault(notification.attempts + 1, []).append(
+                notification.pk)
+    for attempts, pks in failed.items():
+        Notification.objects.filter(pk__in=pks).update(
+            retry_at=_retry_at(attempts, now))
+    return len(notifications)
@@ -0,0 +1,205 @@
+"""
+Cached renders of the pages anonymous visitors see, and versions for the
+template fragments shared by logged in ones.
+
+Every page an anonymous visitor gets is the same for all of them, so
+``cache_anonymous_page`` keeps the render under a key carrying the
+versions of the scopes the page shows: the site-wide group list, a
+group's own row, its members or its events, or one event with its RSVPs.
+Writes bump the versions of the scopes they change, through signals or
+``invalidate``, so an RSVP only drops its event's page and its group's
+page. The names users go by are a scope of their own, ``USERS``, which
+the member and attendee fragments vary on; whole pages don't, and show a
+renamed user once they expire. Stale renders are never looked up again and simply expire after
+``TAVERN_PAGE_CACHE_TIMEOUT`` seconds, which also bounds how long a page
+lags the clock (e.g. an event becoming past).
+
+The CSRF token rendered into a page is visitor specific: it is stored as
+a placeholder and the visitor's own token put back when served.
+
+``conditional_page`` answers conditional GETs of a page with 304 from a
+cheap look up of when it last changed, without rendering it. The answer
+is cached under the page's versions too.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from .listings import get_version, bump_version
+from .models import TavernGroup, Event
+
+SITE_WIDE = 'all'
+
+# The names of all users, rarely changed
+USERS = 'users'
+
+VERSION_KEY = 'tavern:pages:version:%s'
+
+PAGE_KEY = 'tavern:pages:%s:%s'
+
+LOOKUP_KEY = 'tavern:pages:lookup:%s:%s'
+
+CSRF_PLACEHOLDER = b'tavern-csrf-token-placeholder'
+
+
+def group_scope(group_id):
+    """ A group's own row and its organizers """
+    return 'group:%s' % group_id
+
+
+def members_scope(group_id):
+    """ The members of a group """
+    return 'members:%s' % group_id
+
+
+def events_scope(group_id):
+    """ The events of a group, with their RSVP counts """
+    return 'events:%s' % group_id
+
+
+def event_scope(event_id):
+    """ An event and its RSVPs """
+    return 'event:%s' % event_id
+
+
+def version(*scopes):
+    """ The versions of ``scopes``, which cache keys vary on """
+    return '.'.join(str(get_version(VERSION_KEY % scope))
+                    for scope in scopes)
+
+
+def invalidate(*scopes):
+    """ Drops the cached pages and fragments showing any of ``scopes`` """
+    for scope in scopes:
+        bump_version(VERSION_KEY % scope)
+
+
+def invalidate_all():
+    """ Drops every cached page and fragment """
+    scopes = [SITE_WIDE, USERS]
+    for group_id in TavernGroup.objects.values_list('pk', flat=True):
+        scopes += [group_scope(group_id), members_scope(group_id),
+                   events_scope(group_id)]
+    scopes += [event_scope(event_id)
+               for event_id in Event.objects.values_list('pk', flat=True)]
+    # Versions restart from the clock, never at one they had before
+    cache.delete_many([VERSION_KEY % scope for scope in scopes])
+
+
+def _hash(value):
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def lookup(name, scopes, fetch):
+    """
+    ``fetch()``, cached under ``name`` until one of ``scopes`` changes.
+    Maps the slugs of page URLs to the ids their scopes are named by.
+    """
+    key = LOOKUP_KEY % (version(*scopes), _hash(name))
+    cached = cache.get(key)
+    if cached is None:
+        cached = (fetch(),)
+        cache.set(key, cached, settings.TAVERN_PAGE_CACHE_TIMEOUT)
+    return cached[0]
+
+
+def _scopes(request, get_scopes, kwargs):
+    if not hasattr(request, '_tavern_page_scopes'):
+        request._tavern_page_scopes = get_scopes(**kwargs)
+    return request._tavern_page_scopes
+
+
+def _cacheable(request):
+    return (request.method in ('GET', 'HEAD') and
+            not request.user.is_authenticated() and
+            not len(messages.get_messages(request)))
+
+
+def _key(key_format, scopes, path):
+    return key_format % (version(*scopes), _hash(path))
+
+
+def cache_anonymous_page(get_scopes):
+    """
+    Serves the renders of the decorated view to anonymous visitors from
+    the cache, until one of the scopes ``get_scopes(**kwargs)`` returns
+    for the URL's keyword arguments changes; it returns None for missing
+    pages. Only successful responses setting no cookies of their own are
+    kept.
+    """
+    def decorator(view):
+        @wraps(view)
+        def cached_view(request, *args, **kwargs):
+            if not _cacheable(request):
+                return view(request, *args, **kwargs)
+            scopes = _scopes(request, get_scopes, kwargs)
+            if scopes is None:
+                return view(request, *args, **kwargs)
+            key = _key(PAGE_KEY, scopes, request.get_full_path())
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                if CSRF_PLACEHOLDER in content:
+                    content = content.replace(
+                        CSRF_PLACEHOLDER, get_token(request).encode('ascii'))
+                return HttpResponse(content, content_type=content_type)
+
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            if response.status_code == 200 and not response.streaming and \
+                    not response.cookies:
+                content = response.content
+                token = request.META.get('CSRF_COOKIE')
+                if token:
+                    content = content.replace(token.encode('ascii'),
+                                              CSRF_PLACEHOLDER)
+                cache.set(key, (content, response['Content-Type']),
+                          settings.TAVERN_PAGE_CACHE_TIMEOUT)
+            return response
+        return cached_view
+    return decorator
+
+
+def conditional_page(get_scopes, get_last_modified):
+    """
+    Answers ``If-None-Match`` and ``If-Modified-Since`` with 304 when the
+    page has not changed since ``get_last_modified(**kwargs)``, called
+    with the URL's keyword arguments; it returns None for missing pages.
+    The answer is cached until one of the scopes ``get_scopes(**kwargs)``
+    returns changes. Pages differ per user and carry their CSRF token, so
+    both go in the ETag, and only anonymous pages are dated: a date alone
+    can't tell a user who logged in since.
+    """
+    def last_modified(request, *args, **kwargs):
+        if not hasattr(request, '_tavern_last_modified'):
+            scopes = _scopes(request, get_scopes, kwargs)
+            if scopes is None:
+                request._tavern_last_modified = None
+                return None
+            request._tavern_last_modified = lookup(
+                'modified:%s' % request.path, scopes,
+                lambda: get_last_modified(**kwargs))
+        return request._tavern_last_modified
+
+    def etag(request, *args, **kwargs):
+        modified = last_modified(request, *args, **kwargs)
+        if modified is None:
+            return None
+        user = request.user.pk if request.user.is_authenticated() else ''
+        token = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+        validator = '%s:%s:%s' % (modified.isoformat(), user, token)
+        return hashlib.md5(validator.encode('utf-8')).hexdigest()
+
+    def anonymous_last_modified(request, *args, **kwargs):
+        if request.user.is_authenticated():
+            return None
+        return last_modified(request, *args, **kwargs)
+
+    return condition(etag_func=etag, last_modified_func=anonymous_last_modified)
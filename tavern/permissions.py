@@ -0,0 +1,118 @@
+"""
+Object permissions of groups and events, kept in step with their
+creators and organizers.
+
+Rather than removing and assigning each permission one at a time, the
+permissions an object should have are computed and compared with the
+ones it has, and only the difference is written, with one bulk delete
+and one bulk insert. Syncing an object costs a constant number of
+queries whatever changed.
+"""
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.utils.encoding import force_text
+
+from guardian.models import UserObjectPermission
+
+from .models import TavernGroup, Event
+
+# Number of events whose permissions are synced at once
+BATCH_SIZE = 500
+
+# Codenames managed here, by model. Other object permissions are left alone.
+GROUP_PERMISSIONS = ('change_taverngroup', 'delete_taverngroup')
+EVENT_PERMISSIONS = ('change_event', 'delete_event')
+
+
+def sync_object_permissions(obj, codenames, wanted):
+    """
+    Makes the ``codenames`` permissions of users on ``obj`` exactly the
+    ``(user_id, codename)`` pairs of ``wanted``.
+    """
+    sync_objects_permissions(type(obj), codenames, {obj.pk: wanted})
+
+
+def sync_objects_permissions(model, codenames, wanted_by_pk):
+    """
+    ``sync_object_permissions`` for the objects of ``model`` keyed by pk
+    in ``wanted_by_pk``, all in the same number of queries as one.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    permission_ids = dict(Permission.objects.filter(
+        content_type=content_type, codename__in=codenames).values_list(
+        'codename', 'pk'))
+    # Guardian keeps object pks as text
+    wanted = set((force_text(pk), user_id, permission_ids[codename])
+                 for pk, pairs in wanted_by_pk.items()
+                 for user_id, codename in pairs)
+
+    existing = UserObjectPermission.objects.filter(
+        content_type=content_type,
+        object_pk__in=[force_text(pk) for pk in wanted_by_pk],
+        permission__in=permission_ids.values())
+    stale = []
+    for pk, object_pk, user_id, permission_id in existing.values_list(
+            'pk', 'object_pk', 'user', 'permission'):
+        if (object_pk, user_id, permission_id) in wanted:
+            wanted.discard((object_pk, user_id, permission_id))
+        else:
+            stale.append(pk)
+
+    if stale:
+        UserObjectPermission.objects.filter(pk__in=stale).delete()
+    if wanted:
+        UserObjectPermission.objects.bulk_create([
+            UserObjectPermission(content_type=content_type,
+                                 object_pk=object_pk,
+                                 user_id=user_id,
+                                 permission_id=permission_id)
+            for object_pk, user_id, permission_id in wanted])
+
+
+def sync_group_permissions(group):
+    """ Creator may change and delete a group, organizers may change it """
+    wanted = set((group.creator_id, codename) for codename in GROUP_PERMISSIONS)
+    for user_id in group.organizers.values_list('pk', flat=True):
+        wanted.add((user_id, 'change_taverngroup'))
+    sync_object_permissions(group, GROUP_PERMISSIONS, wanted)
+
+
+def sync_event_permissions(event):
+    """ Creators of an event and of its group may change and delete it """
+    group_cache = event._meta.get_field('group').get_cache_name()
+    if hasattr(event, group_cache):
+        group_creator_id = event.group.creator_id
+    else:
+        group_creator_id = TavernGroup.objects.filter(
+            pk=event.group_id).values_list('creator', flat=True)[0]
+    wanted = set((user_id, codename)
+                 for user_id in (event.creator_id, group_creator_id)
+                 for codename in EVENT_PERMISSIONS)
+    sync_object_permissions(event, EVENT_PERMISSIONS, wanted)
+
+
+def sync_group_event_permissions(group):
+    """
+    ``sync_event_permissions`` for every event of ``group``, whose
+    creator changed, a batch of events at a time.
+    """
+    events = Event.objects.filter(group=group).order_by('pk').values_list(
+        'pk', 'creator')
+    after = 0
+    while True:
+        batch = list(events.filter(pk__gt=after)[:BATCH_SIZE])
+        if not batch:
+            break
+        sync_objects_permissions(Event, EVENT_PERMISSIONS, dict(
+            (pk, set((user_id, codename)
+                     for user_id in (creator_id, group.creator_id)
+                     for codename in EVENT_PERMISSIONS))
+            for pk, creator_id in batch))
+        after = batch[-1][0]
+
+
+def delete_object_permissions(obj):
+    """ Removes every user permission on ``obj``, in one query """
+    UserObjectPermission.objects.filter(
+        content_type=ContentType.objects.get_for_model(obj),
+        object_pk=obj.pk).delete()
@@ -0,0 +1,60 @@
+"""
+Scheduling of reminders of upcoming events to their attendees.
+
+Each run queues a reminder of the visible events starting within the
+next ``TAVERN_REMINDER_LEAD_TIME`` seconds. How far runs have got is kept
+in ``Watermark`` rows, so a run only reads the slice of the ``(show,
+starts_at)`` index added since the last one, and the slice of the
+``(show, updated_at)`` index saved since then: events created or moved
+into the window after it was passed, short-notice ones among them, are
+reminded too. Reminders are keyed on the event's start, so no start is
+reminded of twice. As the reminders and the watermarks are written in
+one transaction a run which fails is simply done again by the next one.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Event, Notification, Watermark
+
+WATERMARK = 'reminders'
+
+LAST_RUN = 'reminders:last-run'
+
+# Events saved this long before the last run are looked at again, in case
+# their transaction committed after the run had read them
+OVERLAP = timedelta(minutes=1)
+
+
+def schedule_reminders(now=None):
+    """
+    Queues the reminders due by ``now`` and returns how many events they
+    are of. Concurrent runs wait for each other on the watermark row.
+    """
+    now = now or timezone.now()
+    until = now + timedelta(seconds=settings.TAVERN_REMINDER_LEAD_TIME)
+    with transaction.atomic():
+        watermark, created = Watermark.objects.select_for_update() \
+            .get_or_create(name=WATERMARK, defaults={'value': now})
+        last_run, created = Watermark.objects.get_or_create(
+            name=LAST_RUN, defaults={'value': now})
+        window = Event.visible_events.filter(
+            starts_at__gt=now, starts_at__lte=until).only(
+            'pk', 'group', 'creator', 'starts_at')
+        events = {}
+        if until > watermark.value:
+            for event in window.filter(starts_at__gt=watermark.value):
+                events[event.pk] = event
+        for event in window.filter(
+                updated_at__gte=last_run.value - OVERLAP):
+            events[event.pk] = event
+        reminders = []
+        if events:
+            reminders = Notification.objects.reminders(events.values())
+        watermark.value = max(watermark.value, until)
+        watermark.save()
+        last_run.value = now
+        last_run.save()
+    return len(reminders)
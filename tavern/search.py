@@ -0,0 +1,211 @@
+"""
+Full-text search over groups and events, on the database's own full-text
+index.
+
+On SQLite, groups and visible events are indexed in the ``tavern_search``
+FTS5 table, one row per object, its rowid telling which: twice the pk
+for a group, one more for an event. Like object permissions, an
+object's row is only written when the text it is indexed by changed
+since it was loaded. On PostgreSQL, GIN indexes on weighted tsvector
+expressions of the group and event tables answer searches, and the
+database keeps them in step by itself. Other databases get an unindexed
+search matching words anywhere in the text.
+
+Either way a search finds the objects having every word asked for, best
+ranked first, words of names counting ``NAME_WEIGHT`` times as much. Only
+the newest ``TAVERN_SEARCH_MAX_MATCHES`` groups and events matching are
+ranked, so words found nearly everywhere cost no more than rare ones.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import TavernGroup, Event
+
+NAME_WEIGHT = 4
+
+BATCH_SIZE = 500
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+DOCUMENT_FIELDS = {TavernGroup: ('name', 'description'),
+                   Event: ('name', 'description', 'location', 'show')}
+
+# The document of an object loaded without its fields, equal to none
+UNKNOWN = object()
+
+# The expressions the migration indexes, which queries have to repeat
+# as is for the indexes to be used
+GROUP_VECTOR = ("setweight(to_tsvector('simple', tavern_taverngroup.name), 'A')"
+                " || setweight(to_tsvector('simple', "
+                "tavern_taverngroup.description), 'D')")
+
+EVENT_VECTOR = ("setweight(to_tsvector('simple', tavern_event.name), 'A')"
+                " || setweight(to_tsvector('simple', "
+                "tavern_event.description || ' ' || "
+                "coalesce(tavern_event.location, '')), 'D')")
+
+POSTGRESQL_SEARCH = (
+    "SELECT kind, id, ts_rank(vector, query) AS rank FROM ("
+    "(SELECT 0 AS kind, tavern_taverngroup.id, %s AS vector "
+    "FROM tavern_taverngroup WHERE %s @@ plainto_tsquery('simple', %%(query)s) "
+    "ORDER BY tavern_taverngroup.id DESC LIMIT %%(matches)s) "
+    "UNION ALL "
+    "(SELECT 1, tavern_event.id, %s "
+    "FROM tavern_event WHERE tavern_event.show AND "
+    "%s @@ plainto_tsquery('simple', %%(query)s) "
+    "ORDER BY tavern_event.id DESC LIMIT %%(matches)s)"
+    ") matches, plainto_tsquery('simple', %%(query)s) query "
+    "ORDER BY rank DESC, kind, id LIMIT %%(limit)s OFFSET %%(offset)s" % (
+        GROUP_VECTOR, GROUP_VECTOR, EVENT_VECTOR, EVENT_VECTOR))
+
+SQLITE_SEARCH = ("SELECT rowid FROM (SELECT rowid, bm25(tavern_search, %s, 1) "
+                 "AS score FROM tavern_search WHERE tavern_search MATCH %%s "
+                 "ORDER BY rowid DESC LIMIT %%s) ORDER BY score, rowid "
+                 "LIMIT %%s OFFSET %%s" % NAME_WEIGHT)
+
+
+def words(text):
+    """ Searchable words of ``text``, lower cased """
+    return [word for word in WORD.findall((text or '').lower())
+            if len(word) > 1]
+
+
+def document(obj):
+    """ The name and body ``obj`` is indexed by, None if it is not """
+    if isinstance(obj, Event):
+        if not obj.show:
+            return None
+        return obj.name, ' '.join(text for text in (obj.description,
+                                                    obj.location) if text)
+    return obj.name, obj.description
+
+
+def _indexed():
+    # Only SQLite needs the index written to
+    return connection.vendor == 'sqlite'
+
+
+def _rowid(obj):
+    return obj.pk * 2 + (1 if isinstance(obj, Event) else 0)
+
+
+def remember_document(obj):
+    """
+    Notes the document ``obj`` was loaded with, to tell when it changes.
+    Objects loaded without some of its fields are taken to have changed.
+    """
+    fields = DOCUMENT_FIELDS[type(obj)._meta.concrete_model]
+    if all(field in obj.__dict__ for field in fields):
+        obj._search_document = document(obj)
+    else:
+        obj._search_document = UNKNOWN
+
+
+def sync(obj, created=False):
+    """
+    Indexes the group or event ``obj``, if its document changed. An
+    object just ``created`` has nothing indexed yet.
+    """
+    wanted = document(obj)
+    if not _indexed() or (not created and
+                          wanted == getattr(obj, '_search_document', UNKNOWN)):
+        return
+    cursor = connection.cursor()
+    if not created:
+        cursor.execute('DELETE FROM tavern_search WHERE rowid = %s',
+                       [_rowid(obj)])
+    if wanted is not None:
+        cursor.execute('INSERT INTO tavern_search (rowid, name, body) '
+                       'VALUES (%s, %s, %s)', [_rowid(obj)] + list(wanted))
+    obj._search_document = wanted
+
+
+def remove(obj):
+    """ Drops the deleted group or event ``obj`` from the index """
+    if _indexed():
+        connection.cursor().execute(
+            'DELETE FROM tavern_search WHERE rowid = %s', [_rowid(obj)])
+
+
+def rebuild():
+    """ Indexes every group and event again, inserting in batches """
+    if not _indexed():
+        return
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM tavern_search')
+    for model in (TavernGroup, Event):
+        batch = []
+        for obj in model.objects.iterator():
+            wanted = document(obj)
+            if wanted is not None:
+                batch.append([_rowid(obj)] + list(wanted))
+            if len(batch) >= BATCH_SIZE:
+                cursor.executemany('INSERT INTO tavern_search (rowid, name, '
+                                   'body) VALUES (%s, %s, %s)', batch)
+                batch = []
+        if batch:
+            cursor.executemany('INSERT INTO tavern_search (rowid, name, '
+                               'body) VALUES (%s, %s, %s)', batch)
+
+
+def _sqlite_matches(query_words, offset, limit):
+    match = ' '.join('"%s"' % word for word in query_words)
+    cursor = connection.cursor()
+    cursor.execute(SQLITE_SEARCH, [match, settings.TAVERN_SEARCH_MAX_MATCHES,
+                                   limit, offset])
+    return [(rowid % 2, rowid // 2) for rowid, in cursor.fetchall()]
+
+
+def _postgresql_matches(query_words, offset, limit):
+    query = ' '.join(query_words)
+    cursor = connection.cursor()
+    cursor.execute(POSTGRESQL_SEARCH, {
+        'query': query, 'matches': settings.TAVERN_SEARCH_MAX_MATCHES,
+        'limit': limit, 'offset': offset})
+    return [(kind, pk) for kind, pk, rank in cursor.fetchall()]
+
+
+def _unindexed_matches(query_words, offset, limit):
+    groups = TavernGroup.objects.all()
+    events = Event.visible_events.all()
+    for word in query_words:
+        groups = groups.filter(Q(name__icontains=word) |
+                               Q(description__icontains=word))
+        events = events.filter(Q(name__icontains=word) |
+                               Q(description__icontains=word) |
+                               Q(location__icontains=word))
+    matches = [(0, pk) for pk in groups.order_by('pk').values_list(
+        'pk', flat=True)[:offset + limit]]
+    matches += [(1, pk) for pk in events.order_by('pk').values_list(
+        'pk', flat=True)[:offset + limit]]
+    return matches[offset:offset + limit]
+
+
+def search(query, page=1):
+    """
+    The ``page``th page of the groups and events matching every word of
+    ``query``, best first, ``TAVERN_SEARCH_RESULTS_PER_PAGE`` to a page,
+    and whether there is a next one.
+    """
+    query_words = sorted(set(words(query)))
+    if not query_words:
+        return [], False
+    per_page = settings.TAVERN_SEARCH_RESULTS_PER_PAGE
+    find = {'sqlite': _sqlite_matches,
+            'postgresql': _postgresql_matches}.get(connection.vendor,
+                                                   _unindexed_matches)
+    matches = find(query_words, (page - 1) * per_page, per_page + 1)
+    has_next = len(matches) > per_page
+    matches = matches[:per_page]
+
+    groups = TavernGroup.objects.in_bulk(
+        [pk for is_event, pk in matches if not is_event])
+    events = Event.objects.select_related('group').in_bulk(
+        [pk for is_event, pk in matches if is_event])
+    # Objects deleted since the match are left out
+    results = [(events if is_event else groups).get(pk)
+               for is_event, pk in matches]
+    return [result for result in results if result is not None], has_next
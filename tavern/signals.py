@@ -1,66 +1,163 @@
-from django.db.models.signals import pre_save, post_save, pre_delete, m2m_changed
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete, m2m_changed
 
-from guardian.shortcuts import assign_perm, remove_perm
+from . import listings, pagecache, search
+from .models import TavernGroup, Event, Membership, Attendee
+from .permissions import sync_group_permissions, sync_event_permissions, \
+    sync_group_event_permissions, delete_object_permissions
 
-from .models import TavernGroup, Event
 
+def remember_owners(sender, instance, **kwargs):
+    # What permissions depend on, as loaded, to tell when it changes
+    instance._owners = owners(instance)
 
-def create_group_permission(sender, instance, **kwargs):
-    remove_perm('change_taverngroup', instance.creator, instance)
-    remove_perm('delete_taverngroup', instance.creator, instance)
-    assign_perm('change_taverngroup', instance.creator, instance)
-    assign_perm('delete_taverngroup', instance.creator, instance)
 
+def owners(instance):
+    if isinstance(instance, Event):
+        return instance.creator_id, instance.group_id
+    return instance.creator_id
 
-def create_event_permission(sender, instance, created, **kwargs):
-    remove_perm('change_event', instance.creator, instance)
-    remove_perm('delete_event', instance.creator, instance)
-    remove_perm('change_event', instance.group.creator, instance)
-    remove_perm('delete_event', instance.group.creator, instance)
 
-    assign_perm('change_event', instance.creator, instance)
-    assign_perm('delete_event', instance.creator, instance)
-    assign_perm('change_event', instance.group.creator, instance)
-    assign_perm('delete_event', instance.group.creator, instance)
+def create_group_permission(sender, instance, created, **kwargs):
+    if settings.TAVERN_ROLE_PERMISSIONS:
+        return
+    if created or owners(instance) != instance._owners:
+        sync_group_permissions(instance)
+        if not created:
+            # Its creator may change and delete its events too
+            sync_group_event_permissions(instance)
+        instance._owners = owners(instance)
 
 
-def group_pre_save(sender, instance, **kwargs):
-    if instance.pk:
-        instance._old_m2m = set(list(instance.organizers.values_list('pk', flat=True)))
-    else:
-        instance._old_m2m = set(list())
+def create_event_permission(sender, instance, created, **kwargs):
+    if settings.TAVERN_ROLE_PERMISSIONS:
+        return
+    if created or owners(instance) != instance._owners:
+        sync_event_permissions(instance)
+        instance._owners = owners(instance)
 
 
 def create_group_permission_for_organizers(sender, instance, action, reverse, pk_set, *args, **kwargs):
-    # Assign permissions to all organizers of group
+    # Sync the permissions of the groups whose organizers changed
+    if settings.TAVERN_ROLE_PERMISSIONS:
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        sync_group_permissions(instance)
+        return
     if action == 'post_clear':
-        for pk in instance._old_m2m:
-            user = User.objects.get(pk=pk)
-            remove_perm('change_taverngroup', user, instance)
-    if action == 'post_add' and not reverse:
-        for pk in pk_set:
-            user = User.objects.get(pk=pk)
-            assign_perm('change_taverngroup', user, instance)
+        pk_set = instance._cleared_groups
+    for group in TavernGroup.objects.filter(pk__in=pk_set):
+        sync_group_permissions(group)
+
+
+def remember_cleared_groups(sender, instance, action, reverse, **kwargs):
+    if reverse and action == 'pre_clear':
+        # instance is a user, whose groups are gone after the clear
+        instance._cleared_groups = list(
+            instance.organizes_groups.values_list('pk', flat=True))
+
+
+def touch_organized_groups(sender, instance, action, reverse, pk_set, **kwargs):
+    # Organizers are shown links to manage the group, so its pages change
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        pk_set = [instance.pk]
+    elif action == 'post_clear':
+        pk_set = instance._cleared_groups
+    TavernGroup.objects.filter(pk__in=pk_set).update(updated_at=timezone.now())
+    pagecache.invalidate(*[pagecache.group_scope(pk) for pk in pk_set])
+
+
+def delete_permissions(sender, instance, **kwargs):
+    delete_object_permissions(instance)
+
+
+def invalidate_event_listings(sender, instance, **kwargs):
+    listings.invalidate(instance.group_id)
+
+
+def invalidate_group_listings(sender, instance, **kwargs):
+    listings.invalidate(instance.pk)
+
+
+def invalidate_group_pages(sender, instance, **kwargs):
+    pagecache.invalidate(pagecache.SITE_WIDE,
+                         pagecache.group_scope(instance.pk))
+
+
+def invalidate_event_pages(sender, instance, **kwargs):
+    pagecache.invalidate(pagecache.events_scope(instance.group_id),
+                         pagecache.event_scope(instance.pk))
+
+
+def invalidate_member_pages(sender, instance, **kwargs):
+    pagecache.invalidate(pagecache.SITE_WIDE,
+                         pagecache.members_scope(instance.tavern_group_id))
+
+
+def invalidate_rsvp_pages(sender, instance, **kwargs):
+    pagecache.invalidate(pagecache.events_scope(instance.event.group_id),
+                         pagecache.event_scope(instance.event_id))
+
+
+def remember_user_name(sender, instance, **kwargs):
+    instance._name = user_name(instance)
+
+
+def user_name(user):
+    return user.first_name, user.last_name, user.username
+
+
+def invalidate_user_names(sender, instance, created, **kwargs):
+    # Logins save users too, which shouldn't drop any fragment
+    if not created and user_name(instance) != getattr(instance, '_name', None):
+        pagecache.invalidate(pagecache.USERS)
+        instance._name = user_name(instance)
+
+
+def remember_search_document(sender, instance, **kwargs):
+    search.remember_document(instance)
 
 
-def delete_group_permissions(sender, instance, **kwargs):
-    remove_perm('change_taverngroup', instance.creator, instance)
-    remove_perm('delete_taverngroup', instance.creator, instance)
-    for user in instance.organizers.all():
-        remove_perm('change_taverngroup', user, instance)
+def index_for_search(sender, instance, created, **kwargs):
+    search.sync(instance, created)
 
 
-def delete_event_permissions(sender, instance, **kwargs):
-    remove_perm('change_event', instance.creator, instance)
-    remove_perm('delete_event', instance.creator, instance)
-    remove_perm('change_event', instance.group.creator, instance)
-    remove_perm('delete_event', instance.group.creator, instance)
+def remove_from_search(sender, instance, **kwargs):
+    search.remove(instance)
 
 
+post_init.connect(remember_owners, sender=Event)
+post_init.connect(remember_owners, sender=TavernGroup)
+post_init.connect(remember_search_document, sender=Event)
+post_init.connect(remember_search_document, sender=TavernGroup)
 post_save.connect(create_event_permission, sender=Event)
 post_save.connect(create_group_permission, sender=TavernGroup)
-pre_save.connect(group_pre_save, sender=TavernGroup)
+m2m_changed.connect(remember_cleared_groups, sender=TavernGroup.organizers.through)
 m2m_changed.connect(create_group_permission_for_organizers, sender=TavernGroup.organizers.through)
-pre_delete.connect(delete_group_permissions, sender=TavernGroup)
-pre_delete.connect(delete_event_permissions, sender=Event)
+m2m_changed.connect(touch_organized_groups, sender=TavernGroup.organizers.through)
+pre_delete.connect(delete_permissions, sender=TavernGroup)
+pre_delete.connect(delete_permissions, sender=Event)
+post_save.connect(invalidate_event_listings, sender=Event)
+post_delete.connect(invalidate_event_listings, sender=Event)
+post_save.connect(invalidate_group_listings, sender=TavernGroup)
+post_delete.connect(invalidate_group_listings, sender=TavernGroup)
+post_save.connect(index_for_search, sender=Event)
+post_save.connect(index_for_search, sender=TavernGroup)
+post_delete.connect(remove_from_search, sender=Event)
+post_delete.connect(remove_from_search, sender=TavernGroup)
+post_save.connect(invalidate_group_pages, sender=TavernGroup)
+post_delete.connect(invalidate_group_pages, sender=TavernGroup)
+post_save.connect(invalidate_event_pages, sender=Event)
+post_delete.connect(invalidate_event_pages, sender=Event)
+# A delete receiver would stop memberships and RSVPs being deleted in bulk
+# with their group or event; views deleting them invalidate themselves.
+post_save.connect(invalidate_member_pages, sender=Membership)
+post_save.connect(invalidate_rsvp_pages, sender=Attendee)
+post_init.connect(remember_user_name, sender=User)
+post_save.connect(invalidate_user_names, sender=User)
@@ -1,6 +1,11 @@
 import re
+
+from django.db import transaction, IntegrityError
 from django.template.defaultfilters import slugify
 
+# Times a save is tried with a fresh slug when a concurrent save took it
+SLUG_ATTEMPTS = 3
+
 
 def unique_slugify(instance, value, slug_field_name='slug', queryset=None,
                    slug_separator='-'):
@@ -33,20 +38,47 @@ def unique_slugify(instance, value, slug_field_name='slug', queryset=None,
         queryset = queryset.exclude(pk=instance.pk)
 
     # Find a unique slug. If one matches, at '-2' to the end and try again
-    # (then '-3', etc).
+    # (then '-3', etc). The taken slugs are fetched with one query per
+    # prefix, rather than one query per candidate; the prefix only
+    # changes when a long slug has to be cut to make room for the suffix.
     next_val = 2
-    while not slug or queryset.filter(**{slug_field_name: slug}):
-        slug = original_slug
+    base = original_slug
+    prefix = taken = None
+    while True:
+        if prefix != (base or slug_separator):
+            prefix = base or slug_separator
+            taken = set(queryset.filter(**{
+                '%s__startswith' % slug_field_name: prefix}).values_list(
+                slug_field_name, flat=True))
+        if slug and slug not in taken:
+            break
+        base = original_slug
         end = '%s%s' % (slug_separator, next_val)
-        if slug_len and len(slug) + len(end) > slug_len:
-            slug = slug[:slug_len - len(end)]
-            slug = _slug_strip(slug, slug_separator)
-        slug = '%s%s' % (slug, end)
+        if slug_len and len(base) + len(end) > slug_len:
+            base = base[:slug_len - len(end)]
+            base = _slug_strip(base, slug_separator)
+        slug = '%s%s' % (base, end)
         next_val += 1
 
     setattr(instance, slug_field.attname, slug)
 
 
+def save_with_unique_slug(instance, value, save, queryset=None):
+    """
+    Stores a unique slug of ``value`` on ``instance`` and calls ``save``.
+    If a concurrent save takes the slug first, the unique constraint on
+    it fails the save, which is tried again with a fresh slug.
+    """
+    for attempt in range(SLUG_ATTEMPTS):
+        unique_slugify(instance, value, queryset=queryset)
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError:
+            if attempt == SLUG_ATTEMPTS - 1:
+                raise
+
+
 def _slug_strip(value, separator='-'):
     """
     Cleans up a slug by removing slug separator characters that occur at the
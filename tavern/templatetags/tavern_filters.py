@@ -1,8 +1,11 @@
 from django import template
+from django.conf import settings
 
+from guardian.core import ObjectPermissionChecker
+
+from tavern.loaders import loader_for, loader_for_user
+from tavern.backends import role_permissions
 from tavern.models import TavernGroup
-from tavern.models import get_groups
-from tavern.models import get_rsvp_yes_events
 register = template.Library()
 
 
@@ -21,7 +24,7 @@ class UserTavernGroups(UserTemplateTagMixin, template.Node):
         if not user.__class__.__name__ == "User":
             raise template.TemplateSyntaxError("Invalid arguments passed."
                                                "Argument should be an instance of User")
-        user_groups = get_groups(user)
+        user_groups = loader_for_user(context, user).joined_groups
         context[self.var_name] = user_groups
         return ''
 
@@ -31,22 +34,28 @@ class AllTavernGroups(template.Node):
         self.var_name = var_name
 
     def render(self, context):
-        all_groups = TavernGroup.objects.all()
+        request = context.get('request')
+        if request is not None:
+            all_groups = loader_for(request).all_groups
+        else:
+            all_groups = TavernGroup.objects.all()
         context[self.var_name] = all_groups
         return ''
 
 
 class UserTavernRsvpEvents(UserTemplateTagMixin, template.Node):
 
-    def __init__(self, user, var_name):
+    def __init__(self, user, var_name, limit=None):
         super(UserTavernRsvpEvents, self).__init__(user, var_name)
+        self.limit = limit and template.Variable(limit)
 
     def render(self, context):
         user = self.user.resolve(context)
         if not user.__class__.__name__ == 'User':
             raise template.TemplateSyntaxError("Invalid argument type passed."
                                                " Argument should be an instance of user")
-        events = get_rsvp_yes_events(user)
+        limit = self.limit and int(self.limit.resolve(context))
+        events = loader_for_user(context, user).rsvp_yes_events(limit)
         context[self.var_name] = events
         return ''
 
@@ -77,13 +86,41 @@ def get_all_tavern_groups(parser, token):
 
 @register.tag
 def get_user_tavern_rsvp_yes_events(parser, token):
-    """returns all the events in which user has assigned rsvp as yes
+    """returns the events in which user has assigned rsvp as yes, upcoming
+    ones first, optionally only the first few of them
     {% get_user_tavern_rsvp_yes_events for request.user as attending_events %}
+    {% get_user_tavern_rsvp_yes_events for request.user as attending_events limit 10 %}
     """
+    bits = token.split_contents()
+    limit = None
+    if len(bits) == 7 and bits[5] == 'limit':
+        limit = bits.pop()
+        bits.pop()
     try:
-        tag_name, for_contxt, user, as_contxt, var = token.split_contents()
+        tag_name, for_contxt, user, as_contxt, var = bits
     except:
         raise template.TemplateSyntaxError(("Invalid template tag %r"
                                             "Ex: get_user_tavern_rsvp_yes_events for user as"
-                                            "attending_events"), token.split_contents()[0])
-    return UserTavernRsvpEvents(user, var)
+                                            "attending_events [limit 10]"), token.split_contents()[0])
+    return UserTavernRsvpEvents(user, var, limit)
+
+
+@register.assignment_tag
+def get_tavern_perms(user, obj):
+    """sets the codenames of the permissions user has on a group or event,
+    from their roles or from guardian as TAVERN_ROLE_PERMISSIONS says
+    {% get_tavern_perms request.user group as group_perms %}"""
+    if settings.TAVERN_ROLE_PERMISSIONS:
+        return role_permissions(user, obj)
+    return ObjectPermissionChecker(user).get_perms(obj)
+
+
+@register.assignment_tag(takes_context=True)
+def get_tavern_rsvp_status(context, event):
+    """sets the RSVP status of the requesting user to event, or None; the
+    statuses of all the events the view listed are fetched at once
+    {% get_tavern_rsvp_status event as rsvp_status %}"""
+    request = context.get('request')
+    if request is None:
+        return None
+    return loader_for(request).rsvp_status(event)
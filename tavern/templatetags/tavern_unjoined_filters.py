@@ -1,6 +1,6 @@
 from django import template
 
-from tavern.models import get_unjoined_groups
+from tavern.loaders import loader_for_user
 
 register = template.Library()
 
@@ -14,7 +14,7 @@ class UserUnjoinedTavernGroup(template.Node):
 
     def render(self, context):
         user = self.user.resolve(context)
-        user_unjoined_groups = get_unjoined_groups(user)
+        user_unjoined_groups = loader_for_user(context, user).unjoined_groups
         context[self.var_name] = user_unjoined_groups
         return ''
 
@@ -1,8 +1,34 @@
-from django.test import TestCase, Client
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+from django.db import connection, IntegrityError
+from django.template import Template, Context, RequestContext
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.http import QueryDict
+from django.utils import timezone
+
+from . import benchmark, bulk, exports, listings, pagecache, search
+from guardian.models import UserObjectPermission
 
-from .models import TavernGroup, Membership, Event, Attendee
+from . import notifications, permissions, reminders
+from .forms import AddOrganizerForm, RemoveOrganizerForm
+from .loaders import loader_for, loader_for_user
+from .slugify import save_with_unique_slug
+from .models import TavernGroup, Membership, Event, Attendee, \
+    Notification, get_rsvp_yes_events
 
 from datetime import datetime, timedelta
 
@@ -25,6 +51,62 @@ class TestModels(TestCase):
         self.assertEqual(user.has_perm('change_taverngroup', tavern_group), True)
         self.assertEqual(user.has_perm('delete_taverngroup', tavern_group), False)
 
+    def test_permission_sync(self):
+        """Permissions follow creators and organizers, in a constant
+        number of queries, and saves changing neither write none"""
+        creator = create_and_get_user()
+        group = create_and_get_tavern_group(creator)
+        organizer = create_and_get_user('test2')
+        event = create_and_get_event(user=organizer, tgroup=group)
+        with CaptureQueriesContext(connection) as queries:
+            event.description = 'Changed description'
+            event.save()
+        self.assertFalse([query for query in queries
+                          if 'guardian_' in query['sql']])
+        event = Event.objects.select_related('group').get(pk=event.pk)
+        with self.assertNumQueries(2):
+            permissions.sync_event_permissions(event)
+
+        group.organizers.add(organizer)
+        self.assertTrue(organizer.has_perm('change_taverngroup', group))
+        group.organizers.remove(organizer)
+        organizer = User.objects.get(pk=organizer.pk)
+        self.assertFalse(organizer.has_perm('change_taverngroup', group))
+        organizer.organizes_groups.add(group)
+        organizer = User.objects.get(pk=organizer.pk)
+        self.assertTrue(organizer.has_perm('change_taverngroup', group))
+        organizer.organizes_groups.clear()
+        organizer = User.objects.get(pk=organizer.pk)
+        self.assertFalse(organizer.has_perm('change_taverngroup', group))
+
+        event.creator = creator
+        event.save()
+        organizer = User.objects.get(pk=organizer.pk)
+        self.assertFalse(organizer.has_perm('change_event', event))
+        self.assertTrue(creator.has_perm('delete_event', event))
+
+        # Events follow their group's creator too
+        other = create_and_get_event(create_and_get_user('test3'), group,
+                                     'Other event')
+        self.assertTrue(creator.has_perm('change_event', other))
+        group = TavernGroup.objects.get(pk=group.pk)
+        group.creator = organizer
+        group.save()
+        creator = User.objects.get(pk=creator.pk)
+        organizer = User.objects.get(pk=organizer.pk)
+        self.assertTrue(creator.has_perm('delete_event', event))
+        self.assertFalse(creator.has_perm('change_event', other))
+        self.assertTrue(organizer.has_perm('change_event', event))
+        self.assertTrue(organizer.has_perm('delete_event', other))
+        with CaptureQueriesContext(connection) as queries:
+            permissions.sync_group_event_permissions(group)
+        self.assertEqual(len([query for query in queries
+                              if 'guardian_' in query['sql']]), 1)
+
+        event.delete()
+        self.assertFalse(UserObjectPermission.objects.filter(
+            object_pk=event.pk, permission__codename='change_event').exists())
+
     def test_tavern_group_save(self):
         """When a TavernGroup is saved, we want to make sure
         an instance of Membership which associates the creator
@@ -43,22 +125,154 @@ class TestModels(TestCase):
         member = Membership.objects.all()[0]
         self.assertEqual(member.__unicode__(), u'test - TestGroup')
 
+    def test_tavern_group_slug(self):
+        """Groups whose names slugify alike get distinct slugs"""
+        creator = create_and_get_user()
+        first = create_and_get_tavern_group(creator, name='Python Hyd')
+        second = create_and_get_tavern_group(creator, name='python-hyd')
+        self.assertEqual(first.slug, 'python-hyd')
+        self.assertEqual(second.slug, 'python-hyd-2')
+        first.description = 'Changed description'
+        first.save()
+        self.assertEqual(first.slug, 'python-hyd')
+
+    def test_slug_collisions(self):
+        """Saving an event costs the same number of queries however many
+        slugs of its group collide"""
+        creator = create_and_get_user()
+        group = create_and_get_tavern_group(creator)
+
+        def create(i):
+            with CaptureQueriesContext(connection) as queries:
+                event = create_and_get_event(user=creator, tgroup=group,
+                                             name='Weekly meetup' + '!' * i)
+            return event, len(queries)
+
+        event, first_queries = create(1)
+        self.assertEqual(event.slug, 'weekly-meetup')
+        for i in range(2, 30):
+            event, queries = create(i)
+        self.assertEqual(event.slug, 'weekly-meetup-29')
+        self.assertEqual(queries, first_queries)
+
+    def test_slug_race(self):
+        """A save losing its slug to a concurrent one is tried again with
+        a fresh slug"""
+        creator = create_and_get_user()
+        group = create_and_get_tavern_group(creator, name='Python Hyd')
+        race = TavernGroup(name='python-hyd', creator=creator)
+        attempts = []
+
+        def save():
+            attempts.append(race.slug)
+            if len(attempts) == 1:
+                raise IntegrityError('slug taken')
+        save_with_unique_slug(race, race.name, save)
+        self.assertEqual(attempts, ['python-hyd-2', 'python-hyd-2'])
+
+        def fail():
+            raise IntegrityError('name taken')
+        self.assertRaises(IntegrityError, save_with_unique_slug,
+                          race, race.name, fail)
+
     def test_tavern_attendees(self):
         """Test to assert that two attendee objects are
            created.One object is created after an Event
-           and one object after Attendee"""
+           and one object after Attendee. A user can only
+           have one Attendee per event."""
 
         event = create_and_get_event()
         self.assertEqual(event.__unicode__(), 'Tavern Event')
 
         self.assertEqual(Attendee.objects.count(), 1)
-        attendee = Attendee.objects.create(user=event.creator,
+        user = User.objects.create_user(username='test2',
+                                        email='test2@agiliq.com',
+                                        password='test2')
+        attendee = Attendee.objects.create(user=user,
                                            event=event,
                                            rsvped_on=datetime.now(),
                                            rsvp_status="yes")
         self.assertEqual(Attendee.objects.count(), 2)
         self.assertEqual(attendee.__unicode__(), u' - Tavern Event - yes')
 
+        self.assertRaises(IntegrityError, Attendee.objects.create,
+                          user=event.creator, event=event,
+                          rsvped_on=datetime.now(), rsvp_status="no")
+
+    def test_set_rsvp(self):
+        event = create_and_get_event()
+        user = User.objects.create_user(username='test2',
+                                        email='test2@agiliq.com',
+                                        password='test2')
+        attendee = Attendee.objects.set_rsvp(user, event.pk, 'maybe')
+        self.assertEqual(attendee.event.maybe_count, 1)
+        attendee = Attendee.objects.set_rsvp(user, event.pk, 'no')
+        self.assertEqual((attendee.event.yes_count, attendee.event.no_count,
+                          attendee.event.maybe_count), (1, 1, 0))
+        self.assertEqual(Attendee.objects.filter(user=user).count(), 1)
+
+    def test_rsvp_messages(self):
+        """RSVP messages of many attendees take one query, whether or not
+        their events have an end"""
+        now = timezone.now()
+        event = create_and_get_event()
+        Event.objects.filter(pk=event.pk).update(
+            starts_at=now + timedelta(hours=1), ends_at=None)
+        users = [User.objects.create_user(username='user%s' % i)
+                 for i in range(30)]
+        for user, status in zip(users, itertools.cycle(['yes', 'no', 'maybe'])):
+            Attendee.objects.set_rsvp(user, event.pk, status)
+
+        with self.assertNumQueries(1):
+            messages = set(attendee.get_rsvp() for attendee in
+                           Attendee.objects.with_rsvp_messages(now))
+        self.assertEqual(messages, set(["You are attending this event.",
+                                        "You are not attending this event.",
+                                        "You may attend this event."]))
+        later = now + timedelta(hours=2)
+        with self.assertNumQueries(1):
+            messages = set(attendee.get_rsvp() for attendee in
+                           Attendee.objects.with_rsvp_messages(later))
+        self.assertEqual(messages, set(["You have attended this event.",
+                                        "You did not attend this event."]))
+        attendee = Attendee.objects.get(user=users[0])
+        self.assertEqual(attendee.get_rsvp(later),
+                         "You have attended this event.")
+
+        Event.objects.filter(pk=event.pk).update(starts_at=None)
+        attendee = Attendee.objects.with_rsvp_messages(later).get(
+            user=users[0])
+        self.assertEqual(attendee.get_rsvp(), "You are attending this event.")
+        self.assertFalse(Event(starts_at=None, ends_at=None).is_over())
+
+    def test_rsvp_yes_events(self):
+        """Yes RSVPs come upcoming first, soonest first, then past,
+        latest first, with their groups in the same query"""
+        user = create_and_get_user()
+        group = create_and_get_tavern_group(user)
+        now = timezone.now()
+        events = {}
+        for days in (-2, 3, -1, 1):
+            events[days] = Event.objects.create(
+                group=group, name='Event %s' % days, description='Test',
+                starts_at=now + timedelta(days=days),
+                ends_at=now + timedelta(days=days, hours=1), creator=user)
+        Attendee.objects.filter(event=events[3]).update(rsvp_status='no')
+
+        rsvp_yes_events = get_rsvp_yes_events(user)
+        with self.assertNumQueries(1):
+            self.assertEqual([event.group.name for event in rsvp_yes_events],
+                             [group.name] * 3)
+        self.assertEqual(list(rsvp_yes_events),
+                         [events[1], events[-1], events[-2]])
+        self.assertEqual(list(get_rsvp_yes_events(user)[:1]), [events[1]])
+
+        tag = Template('{% load tavern_filters %}'
+                       '{% get_user_tavern_rsvp_yes_events for user as events limit 2 %}'
+                       '{% for event in events %}{{ event.name }},{% endfor %}')
+        self.assertEqual(tag.render(Context({'user': user})),
+                         'Event 1,Event -1,')
+
     def test_event_permisssions(self):
         """Test that creator of an event have change and delete
         permissions. Creator of the group in which that event is should also
@@ -75,6 +289,55 @@ class TestModels(TestCase):
         self.assertEqual(event_creator.has_perm('change_event', event), True)
         self.assertEqual(event_creator.has_perm('delete_event', event), True)
 
+    def test_counters(self):
+        """Creating a group or an event counts its creator as a member
+        or a yes RSVP, and recount_tavern_counters fixes drift"""
+        event = create_and_get_event()
+        group = TavernGroup.objects.get(pk=event.group.pk)
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual(group.member_count, 1)
+        self.assertEqual((event.yes_count, event.no_count, event.maybe_count),
+                         (1, 0, 0))
+
+        Attendee.objects.filter(event=event).update(rsvp_status='maybe')
+        TavernGroup.objects.update(member_count=7)
+        call_command('recount_tavern_counters')
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual((event.yes_count, event.maybe_count), (0, 1))
+        self.assertEqual(TavernGroup.objects.get(pk=group.pk).member_count, 1)
+
+    def test_event_listings(self):
+        """Listings are cached until an event of theirs changes or their
+        first upcoming event starts"""
+        cache.clear()
+        event = create_and_get_event()
+        event.starts_at = timezone.now() + timedelta(days=1)
+        event.save()
+        other_group = create_and_get_tavern_group(event.creator, name='other')
+        self.assertEqual(listings.upcoming_events(), [event])
+        self.assertEqual(listings.upcoming_events(event.group_id), [event])
+        with self.assertNumQueries(0):
+            listings.upcoming_events()
+            listings.past_events(event.group_id)
+
+        event.name = 'Renamed'
+        event.save()
+        self.assertEqual(listings.upcoming_events()[0].name, 'Renamed')
+        soon = create_and_get_event(user=event.creator, tgroup=other_group)
+        with self.assertNumQueries(2):
+            listings.upcoming_events(event.group_id)
+
+        Event.objects.filter(pk=soon.pk).update(
+            starts_at=timezone.now() + timedelta(seconds=30))
+        listings.invalidate(other_group.pk)
+        timeouts = []
+        cache.set = lambda key, value, timeout: timeouts.append(timeout)
+        try:
+            listings.upcoming_events(other_group.pk)
+        finally:
+            del cache.set
+        self.assertTrue(0 < timeouts[0] <= 30)
+
     def test_event_manager(self):
         """Test the new objects manager that it returns only
         events that have show=True"""
@@ -93,10 +356,60 @@ class TestModels(TestCase):
         self.assertEqual(event1 in Event.visible_events.all(), True)
         self.assertEqual(event2 in Event.visible_events.all(), False)
 
+    def test_search(self):
+        """Groups and events having every word searched for come best
+        match first, and the index follows their changes"""
+        event = create_and_get_event(name='Python meetup')
+        group = event.group
+        group.description = 'Python, Django and more python'
+        group.save()
+        other = create_and_get_event(event.creator, group, 'Go meetup')
+        other.description = 'Not about python'
+        other.save()
+
+        self.assertEqual(search.search('python')[0], [event, group, other])
+        self.assertEqual(search.search('Meetup PYTHON')[0], [event, other])
+        self.assertEqual(search.search('rust')[0], [])
+        self.assertEqual(search.search('!')[0], [])
+
+        with self.settings(TAVERN_SEARCH_RESULTS_PER_PAGE=2):
+            self.assertEqual(search.search('python'), ([event, group], True))
+            self.assertEqual(search.search('python', 2), ([other], False))
+        if connection.vendor == 'sqlite':
+            # Only the newest matches are ranked
+            with self.settings(TAVERN_SEARCH_MAX_MATCHES=2):
+                self.assertEqual(search.search('python')[0], [event, other])
+
+        with CaptureQueriesContext(connection) as queries:
+            event.save()
+        self.assertEqual([query['sql'] for query in queries
+                          if 'tavern_search' in query['sql']], [])
+        other.show = False
+        other.save()
+        event.name = 'Rust meetup'
+        event.save()
+        self.assertEqual(search.search('python')[0], [group])
+        self.assertEqual(search.search('meetup')[0], [event])
+        # Loaded without the fields it is indexed by
+        Event.objects.only('pk', 'group').get(pk=event.pk).save()
+        self.assertEqual(search.search('rust')[0], [event])
+
+        search.rebuild()
+        self.assertEqual(search.search('python')[0], [group])
+        self.assertEqual(search.search('meetup')[0], [event])
+
+        group.delete()
+        self.assertEqual(search.search('meetup')[0], [])
+        if connection.vendor == 'sqlite':
+            cursor = connection.cursor()
+            cursor.execute('SELECT COUNT(*) FROM tavern_search')
+            self.assertEqual(cursor.fetchone(), (0,))
+
 
 class TestViews(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.user = create_and_get_user()
         self.client = Client()
         self.client.login(username="test", password="test")
@@ -111,6 +424,255 @@ class TestViews(TestCase):
         self.assertEqual(len(response.context['groups']), 0)
         self.assertEqual(response.status_code, 200)
 
+    def test_index_groups(self):
+        """Joined groups are listed before unjoined ones and the page
+        costs the same number of queries however many groups exist"""
+        other = User.objects.create_user(username='test2',
+                                         email='test2@agiliq.com',
+                                         password='test2')
+        joined = create_and_get_tavern_group(self.user)
+        unjoined = create_and_get_tavern_group(other, name='group2')
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response.context['joined_groups'], [joined])
+        self.assertEqual(response.context['unjoined_groups'], [unjoined])
+
+        for i in range(5):
+            create_and_get_tavern_group(other, name='group%s' % (i + 3))
+        self.client.get(reverse("index"))
+        with self.assertNumQueries(6):
+            self.client.get(reverse("index"))
+
+        with self.settings(TAVERN_GROUPS_PER_PAGE=3):
+            response = self.client.get(reverse("index"))
+            self.assertEqual(response.context['joined_groups'], [joined])
+            self.assertEqual([group.name for group in response.context['groups']],
+                             ['TestGroup', 'group2', 'group3'])
+            self.assertEqual(response.context['next_url'], '?after=group3')
+            response = self.client.get(reverse("index"), {'after': 'group6'})
+            self.assertEqual([group.name for group in
+                              response.context['unjoined_groups']],
+                             ['group7'])
+            self.assertIsNone(response.context['next_url'])
+            self.assertEqual(response.context['first_url'], '?')
+
+            for i in range(3):
+                create_and_get_tavern_group(self.user, name='mine%s' % i)
+            response = self.client.get(reverse("index"), {'after': 'group6'})
+            self.assertEqual([group.name for group in
+                              response.context['joined_groups']],
+                             ['TestGroup', 'mine0', 'mine1'])
+            next_url = response.context['joined_next_url']
+            self.assertEqual(QueryDict(next_url[1:]),
+                             QueryDict('after=group6&joined_after=mine1'))
+            response = self.client.get(reverse("index") + next_url)
+            self.assertEqual([group.name for group in
+                              response.context['joined_groups']], ['mine2'])
+            self.assertIsNone(response.context['joined_next_url'])
+            self.assertEqual(response.context['joined_first_url'],
+                             '?after=group6')
+            self.assertEqual([group.name for group in
+                              response.context['unjoined_groups']],
+                             ['group7'])
+
+    def test_anonymous_page_cache(self):
+        """Anonymous renders are served from the cache, with the visitor's
+        own CSRF token, until an RSVP or event changes"""
+        event = create_and_get_event(user=self.user)
+        url = reverse('tavern_group_details', kwargs={'slug': event.group.slug})
+        visitor = Client()
+        first = visitor.get(url)
+        token = first.cookies['csrftoken'].value
+        self.assertIn(token, first.content)
+        with self.assertNumQueries(0):
+            cached = Client().get(url)
+        self.assertIsNone(cached.context)
+        other_token = cached.cookies['csrftoken'].value
+        self.assertNotEqual(other_token, token)
+        self.assertIn(other_token, cached.content)
+        self.assertNotIn(token, cached.content)
+        self.assertIsNotNone(self.client.get(url).context)
+
+        url = event.get_absolute_url()
+        self.assertNotIn('<li>guest</li>', visitor.get(url).content)
+        Attendee.objects.set_rsvp(create_and_get_user('guest'), event.pk,
+                                  'yes')
+        self.assertIn('<li>guest</li>', visitor.get(url).content)
+        event.description = 'Changed description'
+        event.save()
+        self.assertIn('Changed description', visitor.get(url).content)
+
+    def test_page_cache_scopes(self):
+        """Writes only drop the cached pages showing what they changed"""
+        event = create_and_get_event(user=self.user)
+        other_group = create_and_get_tavern_group(self.user, name='Other')
+        other_event = create_and_get_event(user=self.user, tgroup=other_group,
+                                           name='Other Event')
+        urls = [reverse('index'), event.group.get_absolute_url(),
+                event.get_absolute_url(), other_group.get_absolute_url(),
+                other_event.get_absolute_url()]
+        index, group, event_url = urls[:3]
+
+        def cached(url):
+            return Client().get(url).context is None
+
+        for url in urls:
+            Client().get(url)
+        Attendee.objects.set_rsvp(create_and_get_user('guest'), event.pk,
+                                  'yes')
+        self.assertEqual([url for url in urls if not cached(url)],
+                         [group, event_url])
+        Membership.objects.create(user=User.objects.get(username='guest'),
+                                  tavern_group=event.group,
+                                  join_date=timezone.now())
+        self.assertEqual([url for url in urls if not cached(url)],
+                         [index, group])
+        event.group.organizers.add(User.objects.get(username='guest'))
+        self.assertEqual([url for url in urls if not cached(url)],
+                         [group, event_url])
+
+    def test_fragment_user_names(self):
+        """Cached member and attendee lists follow renamed users, and
+        logins keep them"""
+        event = create_and_get_event(user=self.user)
+        guest = create_and_get_user('guest')
+        Membership.objects.create(user=guest, tavern_group=event.group,
+                                  join_date=timezone.now())
+        Attendee.objects.set_rsvp(guest, event.pk, 'yes')
+        urls = [event.group.get_absolute_url(), event.get_absolute_url()]
+        for url in urls:
+            self.assertContains(self.client.get(url), 'guest')
+
+        version = pagecache.version(pagecache.USERS)
+        self.assertTrue(Client().login(username='guest', password='test'))
+        self.assertEqual(pagecache.version(pagecache.USERS), version)
+        guest = User.objects.get(pk=guest.pk)
+        guest.first_name = 'Renamed'
+        guest.save()
+        for url in urls:
+            self.assertContains(self.client.get(url), 'Renamed')
+
+    def test_conditional_get(self):
+        """Detail pages answer conditional GETs with 304 until they change,
+        without rendering"""
+        event = create_and_get_event(user=self.user)
+        url = event.get_absolute_url()
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIsNone(response.context)
+        Attendee.objects.set_rsvp(create_and_get_user('guest'), event.pk,
+                                  'maybe')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        url = event.group.get_absolute_url()
+        visitor = Client()
+        response = visitor.get(url)
+        response = visitor.get(url,
+                               HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        # Now including the CSRF cookie set by the first response
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            visitor.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        event.group.organizers.add(User.objects.get(username='guest'))
+        self.assertEqual(
+            visitor.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        missing = reverse('tavern_group_details', kwargs={'slug': 'missing'})
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_template_tags_share_loader(self):
+        """Template tags asking for the same data of the requesting user
+        fetch it once per request"""
+        group = create_and_get_tavern_group(self.user)
+        create_and_get_tavern_group(self.user, name='group2')
+        request = RequestFactory().get('/')
+        request.user = self.user
+        tags = Template(
+            '{% load tavern_filters tavern_unjoined_filters %}'
+            '{% get_user_tavern_groups for request.user as groups %}'
+            '{% get_user_tavern_groups for request.user as groups_again %}'
+            '{% get_all_tavern_groups as all_groups %}'
+            '{% get_user_tavern_unjoined_groups for request.user as unjoined %}'
+            '{{ groups|length }} {{ groups_again|length }} '
+            '{{ all_groups|length }} {{ unjoined|length }}')
+        with self.assertNumQueries(4):
+            output = tags.render(RequestContext(request))
+        self.assertEqual(output, '2 2 2 0')
+        self.assertTrue(loader_for(request).is_member(group))
+
+        other = create_and_get_tavern_group(create_and_get_user('test2'),
+                                            name='group3')
+        loader = loader_for_user({}, self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(loader.unjoined_groups[:1]), [other])
+        with self.assertNumQueries(1):
+            self.assertTrue(loader.is_member(group))
+            self.assertTrue(loader.is_member(group))
+        with self.assertNumQueries(1):
+            self.assertFalse(loader.is_member(other))
+
+    def test_get_tavern_perms(self):
+        """The tag assigns the user's permissions on the object"""
+        group = create_and_get_tavern_group(self.user)
+        tag = Template('{% load tavern_filters %}'
+                       '{% get_tavern_perms user group as group_perms %}'
+                       '{% if "delete_taverngroup" in group_perms %}yes'
+                       '{% endif %}')
+        self.assertEqual(tag.render(Context({'user': self.user,
+                                             'group': group})), 'yes')
+        other = create_and_get_user('test2')
+        self.assertEqual(tag.render(Context({'user': other,
+                                             'group': group})), '')
+        response = self.client.get(group.get_absolute_url())
+        self.assertContains(response, 'Add/Remove Organizers')
+
+    def test_rsvp_statuses(self):
+        """Listings show the user's RSVP to each event, all fetched in
+        one query, and the statuses of more events come as JSON"""
+        group = create_and_get_tavern_group(self.user)
+        now = timezone.now()
+        events = [Event.objects.create(group=group, name='Event %s' % i,
+                                       description='Test cases',
+                                       starts_at=now + timedelta(days=i),
+                                       ends_at=now + timedelta(days=i),
+                                       creator=self.user)
+                  for i in range(-3, 4) if i]
+        Attendee.objects.filter(event=events[0]).update(rsvp_status='no')
+        Attendee.objects.filter(event=events[4]).delete()
+        url = reverse('tavern_group_details', kwargs={'slug': group.slug})
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len([query for query in queries
+                              if 'tavern_attendee' in query['sql']]), 1)
+        self.assertContains(response, 'rsvp-status">yes<', count=4)
+        self.assertContains(response, 'rsvp-status">no<', count=1)
+
+        response = self.client.get(reverse('rsvp_statuses'), {
+            'events': '%s,%s,%s' % (events[0].pk, events[4].pk,
+                                    events[5].pk)})
+        self.assertEqual(json.loads(response.content)['statuses'],
+                         {str(events[0].pk): 'no', str(events[4].pk): None,
+                          str(events[5].pk): 'yes'})
+        response = self.client.get(reverse('rsvp_statuses'),
+                                   {'events': '1,x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_view(self):
+        event = create_and_get_event(self.user, name='Python meetup')
+        response = self.client.get(reverse('tavern_search'),
+                                   {'q': 'python', 'page': 'x'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['results']), [event])
+        self.assertContains(response, event.get_absolute_url())
+        response = self.client.get(reverse('tavern_search'))
+        self.assertEqual(response.context['results'], [])
+
     def test_create_event(self):
         creator = self.user
         group = create_and_get_tavern_group(creator)
@@ -167,6 +729,51 @@ class TestViews(TestCase):
                                            kwargs={'slug': 'incorrect_slug',
                                                    'group': event.group.slug}))
         self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("tavern_event_details",
+                                           kwargs={'slug': event.slug,
+                                                   'group': event.group.slug}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_event_details_queries(self):
+        """The event page costs the same number of queries however many
+        attendees the event has, and lists them a page at a time"""
+        event = create_and_get_event(self.user)
+        url = reverse("tavern_event_details",
+                      kwargs={'slug': event.slug, 'group': event.group.slug})
+        self.client.get(url)
+
+        def get(**data):
+            # Not served from the cached attendee list fragment
+            pagecache.invalidate(pagecache.event_scope(event.pk))
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, data)
+            return response, queries
+
+        response, few = get()
+        self.assertEqual(response.context['attendee_rsvp'],
+                         "You are attending this event.")
+        self.assertContains(response, '<li>test</li>')
+
+        users = [User.objects.create_user(username='user%s' % i)
+                 for i in range(settings.TAVERN_ATTENDEES_PER_PAGE + 5)]
+        Attendee.objects.bulk_create([
+            Attendee(user=user, event=event, rsvped_on=timezone.now())
+            for user in users])
+        response, many = get()
+        self.assertEqual(len(many), len(few))
+        attendees = response.context['event_attendees']
+        self.assertEqual(len(attendees), settings.TAVERN_ATTENDEES_PER_PAGE)
+        self.assertEqual(attendees[0].user, self.user)
+        per_page = settings.TAVERN_ATTENDEES_PER_PAGE
+        for user in [self.user] + users[:per_page - 1]:
+            self.assertContains(response, '<li>%s</li>' % user.username)
+        self.assertNotContains(response, '<li>%s</li>' % users[-1].username)
+
+        response, later = get(page=2)
+        self.assertEqual(len(later), len(few))
+        self.assertEqual([attendee.user for attendee in
+                          response.context['event_attendees']], users[-6:])
+        self.assertContains(response, '<li>%s</li>' % users[-1].username)
 
     def test_tavern_toggle_member(self):
         group = create_and_get_tavern_group(self.user)
@@ -241,11 +848,276 @@ class TestViews(TestCase):
         response = self.client.get(reverse("change_rsvp",
                                            kwargs={'event_id': event.pk, 'rsvp_status': 'no'}))
         self.assertContains(response, 'You are not attending this event')
+        self.assertEqual(json.loads(response.content)['counts'],
+                         {'yes': 0, 'no': 1, 'maybe': 0})
+
+        response = self.client.get(reverse("change_rsvp",
+                                           kwargs={'event_id': event.pk, 'rsvp_status': 'nope'}))
+        self.assertEqual(response.status_code, 400)
 
         response = self.client.get(reverse("change_rsvp",
                                            kwargs={'event_id': event.pk, 'rsvp_status': 'maybe'}))
         self.assertContains(response, 'You may attend this event')
 
+    def test_rsvp_counters(self):
+        event = create_and_get_event(user=self.user)
+        self.client.get(reverse("change_rsvp",
+                                kwargs={'event_id': event.pk, 'rsvp_status': 'no'}))
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual((event.yes_count, event.no_count, event.maybe_count),
+                         (0, 1, 0))
+
+        attendee = Attendee.objects.get(event=event, user=self.user)
+        self.client.post(reverse("delete_rsvp", kwargs={'pk': attendee.pk}))
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual((event.yes_count, event.no_count, event.maybe_count),
+                         (0, 0, 0))
+        # As a second concurrent removal finds it once it gets the lock
+        response = self.client.post(reverse("delete_rsvp",
+                                            kwargs={'pk': attendee.pk}))
+        self.assertEqual(response.status_code, 404)
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual((event.yes_count, event.no_count, event.maybe_count),
+                         (0, 0, 0))
+        self.assertEqual(Notification.objects.filter(
+            kind='rsvp', rsvp_status='').count(), 1)
+
+    def test_member_counter(self):
+        user = User.objects.create_user(username='test2',
+                                        email='test2@agiliq.com',
+                                        password='test2')
+        group = create_and_get_tavern_group(user)
+        self.client.post(reverse('tavern_toggle_member'),
+                         {'user_id': self.user.id, 'slug': group.slug})
+        self.assertEqual(TavernGroup.objects.get(pk=group.pk).member_count, 2)
+        self.client.post(reverse('tavern_toggle_member'),
+                         {'user_id': self.user.id, 'slug': group.slug})
+        self.assertEqual(TavernGroup.objects.get(pk=group.pk).member_count, 1)
+
+    def test_import_rsvps(self):
+        event = create_and_get_event(user=self.user)
+        for i in range(3):
+            User.objects.create_user(username='user%s' % i, password='user')
+        url = reverse('import_rsvps', kwargs={'group': event.group.slug,
+                                              'slug': event.slug})
+        upload = SimpleUploadedFile(
+            'rsvps.csv',
+            'username,rsvp_status\nuser0,yes\nuser1,maybe\n'
+            'test,no\nghost,yes\nuser2,perhaps\n')
+        response = self.client.post(url, {'file': upload})
+        summary = json.loads(response.content)
+        self.assertEqual((summary['created'], summary['updated'],
+                          summary['rejected']), (2, 1, 2))
+        self.assertEqual([error['line'] for error in summary['errors']], [5, 6])
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual((event.yes_count, event.no_count, event.maybe_count),
+                         (1, 1, 1))
+
+        upload = SimpleUploadedFile(
+            'rsvps.json', '{"username": "user0", "rsvp_status": "no"}\n'
+                          'not json\n')
+        response = self.client.post(url, {'file': upload, 'format': 'json'})
+        summary = json.loads(response.content)
+        self.assertEqual((summary['updated'], summary['rejected']), (1, 1))
+
+    def test_import_malformed_rsvps(self):
+        """Rows which can't be used are rejected one by one, with a
+        reason, and every row is counted once"""
+        event = create_and_get_event(user=self.user)
+        User.objects.create_user(username='user0', password='user')
+        url = reverse('import_rsvps', kwargs={'group': event.group.slug,
+                                              'slug': event.slug})
+        upload = SimpleUploadedFile(
+            'rsvps.csv', 'user0,yes\ncaf\xe9,yes\nuser0,no\n')
+        summary = json.loads(self.client.post(url, {'file': upload}).content)
+        self.assertEqual((summary['created'], summary['rejected']), (1, 2))
+        self.assertEqual([error['error'] for error in summary['errors']],
+                         ['Username is not UTF-8', 'user0 is also on line 1'])
+
+        upload = SimpleUploadedFile(
+            'rsvps.json', '{"username": "user0", "rsvp_status": ["no"]}\n'
+                          '{"username": 7, "rsvp_status": "no"}\n'
+                          '{"username": {}, "rsvp_status": {}}\n'
+                          '{"username": "test", "rsvp_status": "yes"}\n')
+        response = self.client.post(url, {'file': upload, 'format': 'json'})
+        summary = json.loads(response.content)
+        self.assertEqual((summary['created'], summary['updated'],
+                          summary['unchanged'], summary['rejected']),
+                         (0, 0, 1, 3))
+        self.assertEqual(Attendee.objects.get(user__username='user0',
+                                              event=event).rsvp_status, 'yes')
+
+    def test_import_rsvps_batches(self):
+        """Usernames are resolved with one query per batch of rows"""
+        event = create_and_get_event(user=self.user)
+        rows = [(line, 'user%s' % line, 'yes')
+                for line in range(bulk.BATCH_SIZE * 2)]
+        User.objects.bulk_create([User(username=username)
+                                  for line, username, status in rows])
+        with CaptureQueriesContext(connection) as queries:
+            summary = bulk.import_rsvps(event, iter(rows))
+        user_queries = [query for query in queries
+                        if 'FROM "auth_user"' in query['sql']]
+        self.assertEqual(len(user_queries), 2)
+        self.assertEqual(summary['created'], bulk.BATCH_SIZE * 2)
+
+    def test_export_rsvps(self):
+        event = create_and_get_event(user=self.user)
+        url = reverse('export_rsvps', kwargs={'group': event.group.slug,
+                                              'slug': event.slug})
+        response = self.client.get(url)
+        lines = ''.join(response.streaming_content).splitlines()
+        self.assertEqual(lines[0], 'username,rsvp_status,rsvped_on')
+        self.assertTrue(lines[1].startswith('test,yes,'))
+
+        response = self.client.get(url, {'format': 'json'})
+        row = json.loads(''.join(response.streaming_content))
+        self.assertEqual(row['username'], 'test')
+
+        self.client.logout()
+        self.client.login(username=create_and_get_user('test2').username,
+                          password='test')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_group_events_feed(self):
+        """Group pages list the group's own events, and the rest of them
+        page by page through the feed"""
+        group = create_and_get_tavern_group(self.user)
+        other = create_and_get_event(
+            user=self.user,
+            tgroup=create_and_get_tavern_group(self.user, name='Other'))
+        now = timezone.now()
+        for i in range(settings.TAVERN_EVENTS_LIMIT + 2):
+            Event.objects.create(group=group, name='Event %s' % i,
+                                 description='Test cases',
+                                 starts_at=now - timedelta(days=i + 1),
+                                 ends_at=now - timedelta(days=i + 1),
+                                 creator=self.user)
+        response = self.client.get(reverse('tavern_group_details',
+                                           kwargs={'slug': group.slug}))
+        past_events = response.context['past_events']
+        self.assertEqual(len(past_events), settings.TAVERN_EVENTS_LIMIT)
+        self.assertNotIn(other, past_events)
+        self.assertEqual(past_events[0].name, 'Event 0')
+        self.assertEqual(response.context['upcoming_more_url'], None)
+
+        data = json.loads(self.client.get(
+            response.context['past_more_url']).content)
+        self.assertEqual([event['name'] for event in data['events']],
+                         ['Event 10', 'Event 11'])
+        self.assertEqual(data['next'], None)
+
+        url = reverse('group_events_feed', kwargs={'slug': group.slug,
+                                                   'when': 'past'})
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 400)
+
+    def test_group_members(self):
+        """The directory lists members latest to join first, page by
+        page, with ties on the join date broken by id"""
+        group = create_and_get_tavern_group(self.user)
+        Membership.objects.filter(tavern_group=group).update(
+            join_date=timezone.now() - timedelta(days=1))
+        joined = timezone.now()
+        users = [User.objects.create_user(username='member%s' % i)
+                 for i in range(5)]
+        Membership.objects.bulk_create([
+            Membership(user=user, tavern_group=group, join_date=joined)
+            for user in users])
+        expected = [user.username for user in reversed(users)] + ['test']
+
+        with self.settings(TAVERN_MEMBERS_PER_PAGE=2):
+            response = self.client.get(reverse('group_members',
+                                               kwargs={'slug': group.slug}))
+            names = [member.get_name() for member in response.context['members']]
+            url = response.context['more_url']
+            while url:
+                data = json.loads(self.client.get(url).content)
+                names.extend(member['name'] for member in data['members'])
+                url = data['next']
+        self.assertEqual(names, expected)
+
+        response = self.client.get(reverse('tavern_group_details',
+                                           kwargs={'slug': group.slug}))
+        self.assertEqual([member.get_name() for member in
+                          response.context['recent_group_members']()],
+                         expected[:5])
+        url = reverse('group_members_feed', kwargs={'slug': group.slug})
+        self.assertEqual(self.client.get(url, {'after': '1-x'}).status_code,
+                         400)
+
+    def test_export_group_events(self):
+        event = create_and_get_event(user=self.user)
+        Event.objects.filter(pk=event.pk).update(location='Hyderabad, India')
+        url = reverse('export_group_events', kwargs={'slug': event.group.slug})
+        self.client.logout()
+        response = self.client.get(url)
+        lines = ''.join(response.streaming_content).splitlines()
+        self.assertEqual(lines[0], ','.join(exports.EVENT_FIELDS))
+        self.assertTrue(lines[1].startswith('%s,' % event.slug))
+        self.assertTrue(lines[1].endswith(',"Hyderabad, India",1,0,0'))
+
+        response = self.client.get(url, {'format': 'ics'})
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        ical = ''.join(response.streaming_content)
+        self.assertIn('UID:event-%s@testserver\r\n' % event.pk, ical)
+        self.assertIn('LOCATION:Hyderabad\\, India\r\n', ical)
+        self.assertTrue(ical.endswith('END:VCALENDAR\r\n'))
+
+    def test_export_group_attendees(self):
+        event = create_and_get_event(user=self.user)
+        url = reverse('export_group_attendees', kwargs={'slug': event.group.slug})
+        lines = ''.join(self.client.get(url).streaming_content).splitlines()
+        self.assertEqual(lines[0], 'event,username,rsvp_status,rsvped_on')
+        self.assertTrue(lines[1].startswith('%s,test,yes,' % event.slug))
+
+        self.client.logout()
+        self.client.login(username=create_and_get_user('test2').username,
+                          password='test')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_event_ical(self):
+        event = create_and_get_event(user=self.user)
+        Event.objects.filter(pk=event.pk).update(name=u'\u0c39' * 40)
+        url = reverse('tavern_event_ical', kwargs={'group': event.group.slug,
+                                                   'slug': event.slug})
+        ical = ''.join(self.client.get(url).streaming_content)
+        for line in ical.split('\r\n'):
+            self.assertLessEqual(len(line), 75)
+        self.assertIn((u'SUMMARY:' + u'\u0c39' * 40).encode('utf-8'),
+                      ical.replace('\r\n ', ''))
+
+        Event.objects.filter(pk=event.pk).update(show=False)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(TAVERN_ROLE_PERMISSIONS=True)
+    def test_role_permissions(self):
+        """With role permissions no guardian rows are written and rights
+        follow creators and organizers"""
+        event = create_and_get_event(user=self.user)
+        group = event.group
+        self.assertEqual(UserObjectPermission.objects.count(), 0)
+        response = self.client.get(reverse('tavern_event_update',
+                                           kwargs={'slug': event.slug}))
+        self.assertEqual(response.status_code, 200)
+
+        organizer = create_and_get_user('test2')
+        update_url = reverse('tavern_group_update', kwargs={'slug': group.slug})
+        self.client.login(username='test2', password='test')
+        self.assertEqual(self.client.get(update_url).status_code, 403)
+        group.organizers.add(organizer)
+        self.assertEqual(self.client.get(update_url).status_code, 200)
+        self.assertEqual(self.client.post(reverse('delete_group',
+                                                  kwargs={'slug': group.slug})
+                                          ).status_code, 403)
+        self.assertEqual(UserObjectPermission.objects.count(), 0)
+
+        organizer = User.objects.get(pk=organizer.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(organizer.has_perm('tavern.change_taverngroup', group))
+            self.assertTrue(organizer.has_perm('change_taverngroup', group))
+        self.assertFalse(organizer.has_perm('delete_taverngroup', group))
+        self.assertFalse(organizer.has_perm('change_event', event))
+
     def test_delete_rsvp(self):
         event = create_and_get_event(user=self.user)
         attendee = Attendee.objects.get(event=event, user=self.user)
@@ -280,9 +1152,363 @@ class TestViews(TestCase):
                              status_code=302)
         self.assertEqual(org in group.organizers.all(), False)
 
+    def test_edit_organizers_in_bulk(self):
+        """Adding or removing organizers costs the same number of queries
+        however many there are"""
+        group = create_and_get_tavern_group(self.user)
+        url = reverse('edit_organizers', kwargs={'slug': group.slug})
+        users = [User.objects.create_user(username='org%s' % i)
+                 for i in range(30)]
+        counts = []
+        for action, chosen in (('add', users[:2]), ('add', users[2:]),
+                               ('remove', users[:2]), ('remove', users[2:])):
+            usernames = ','.join(user.username for user in chosen)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, {'usernames': usernames,
+                                                  'action': action})
+            self.assertEqual(response.status_code, 302)
+            counts.append(len(queries))
+            if action == 'add':
+                self.assertTrue(all(
+                    user.has_perm('tavern.change_taverngroup', group)
+                    for user in chosen))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(counts[2], counts[3])
+        self.assertEqual(list(group.organizers.all()), [])
+        self.assertEqual(UserObjectPermission.objects.filter(
+            object_pk=group.pk).exclude(user=self.user).count(), 0)
+
+    def test_organizer_forms(self):
+        """Usernames are resolved in one query, and checked to be
+        organizers in one more, however many there are"""
+        group = create_and_get_tavern_group(self.user)
+        users = [User.objects.create_user(username='org%s' % i)
+                 for i in range(20)]
+        usernames = ', '.join(user.username for user in users)
+        with CaptureQueriesContext(connection) as queries:
+            form = AddOrganizerForm({'usernames': usernames}, group=group)
+            self.assertTrue(form.is_valid())
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(form.cleaned_data['users'], users)
+
+        group.organizers.add(*users[:10])
+        with CaptureQueriesContext(connection) as queries:
+            form = RemoveOrganizerForm({'usernames': usernames}, group=group)
+            self.assertFalse(form.is_valid())
+        self.assertEqual(len(queries), 2)
+        self.assertIn('org10, org11', form.non_field_errors()[0])
+
+        form = AddOrganizerForm({'usernames': 'org1, nobody, ghost'},
+                                group=group)
+        self.assertEqual(form.non_field_errors(),
+                         ['nobody, ghost is not a user'])
+        form = AddOrganizerForm({'usernames': ' , '}, group=group)
+        self.assertFalse(form.is_valid())
+
+    def test_organizer_autocomplete(self):
+        group = create_and_get_tavern_group(self.user)
+        for username in ('org-b', 'org-a', 'other'):
+            User.objects.create_user(username=username, password=username)
+        url = reverse('organizer_autocomplete', kwargs={'slug': group.slug})
+        response = self.client.get(url, {'q': 'org'})
+        self.assertEqual(json.loads(response.content),
+                         {'usernames': ['org-a', 'org-b']})
+        response = self.client.get(url, {'q': 'org_'})
+        self.assertEqual(json.loads(response.content), {'usernames': []})
+        response = self.client.get(url)
+        self.assertEqual(json.loads(response.content), {'usernames': []})
+
+        self.client.login(username='org-a', password='org-a')
+        self.assertEqual(self.client.get(url, {'q': 'org'}).status_code, 403)
+
+
+class TestRsvpConcurrency(TransactionTestCase):
+
+    def test_concurrent_rsvps(self):
+        """Many threads changing RSVPs to one event at once leave one
+        Attendee per user and counters matching the Attendee table"""
+        if connection.vendor == 'sqlite':
+            self.skipTest("SQLite test databases are in memory and "
+                          "can't be shared between threads")
+        event = create_and_get_event()
+        users = [User.objects.create_user(username='user%s' % i,
+                                          password='user')
+                 for i in range(10)]
+
+        errors = []
+
+        def hammer(user):
+            try:
+                for status in ('maybe', 'no', 'yes', 'maybe'):
+                    Attendee.objects.set_rsvp(user, event.pk, status)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=hammer, args=(user,))
+                   for user in users for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual(Attendee.objects.filter(event=event).count(), 11)
+        self.assertEqual((event.yes_count, event.no_count, event.maybe_count),
+                         (1, 0, 10))
+
+    def test_rsvp_losing_race(self):
+        """A first RSVP losing the race to a concurrent one updates the
+        concurrent one, on every database"""
+        event = create_and_get_event()
+        user = create_and_get_user('racer')
+        # The concurrent RSVP, committed after the lookup below missed it
+        Attendee.objects.set_rsvp(user, event.pk, 'no')
+        manager = Attendee.objects
+        manager.filter = lambda **kwargs: manager.none()
+        try:
+            attendee = Attendee.objects.set_rsvp(user, event.pk, 'yes')
+        finally:
+            del manager.filter
+        self.assertEqual(attendee.rsvp_status, 'yes')
+        self.assertEqual(list(Attendee.objects.filter(event=event, user=user)
+                              .values_list('rsvp_status', flat=True)), ['yes'])
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual((event.yes_count, event.no_count, event.maybe_count),
+                         (2, 0, 0))
+
+
+class FailingBackend(object):
+
+    def send(self, subject, body, recipients):
+        raise IOError('Mail server unavailable')
+
+
+class TestNotifications(TestCase):
+
+    def setUp(self):
+        self.event = create_and_get_event()
+        self.group = self.event.group
+        self.organizer = User.objects.create_user(
+            username='organizer', email='organizer@agiliq.com',
+            password='organizer')
+        self.group.organizers.add(self.organizer)
+        self.user = User.objects.create_user(username='test2',
+                                             email='test2@agiliq.com',
+                                             password='test2')
+
+    def test_changes_are_queued(self):
+        """RSVPs and membership changes queue one notification each, and
+        an unchanged RSVP none"""
+        Attendee.objects.set_rsvp(self.user, self.event.pk, 'maybe')
+        Attendee.objects.set_rsvp(self.user, self.event.pk, 'maybe')
+        Attendee.objects.set_rsvp(self.user, self.event.pk, 'yes')
+        client = Client()
+        client.login(username='test2', password='test2')
+        for i in range(2):
+            client.post(reverse('tavern_toggle_member'),
+                        {'user_id': self.user.pk, 'slug': self.group.slug})
+        attendee = Attendee.objects.get(user=self.user, event=self.event)
+        client.post(reverse('delete_rsvp', kwargs={'pk': attendee.pk}))
+        self.assertEqual(
+            list(Notification.objects.pending().values_list(
+                'kind', 'rsvp_status')),
+            [('rsvp', 'maybe'), ('rsvp', 'yes'), ('joined', ''),
+             ('left', ''), ('rsvp', '')])
+        self.assertEqual(mail.outbox, [])
+        notifications.deliver_pending()
+        self.assertIn('test2 removed their RSVP to Tavern Event',
+                      [message.subject for message in mail.outbox])
+
+    def test_deliver_pending(self):
+        """Notifications go to the group's creator and organizers, in
+        batches costing the same number of queries whatever their size"""
+        Attendee.objects.set_rsvp(self.user, self.event.pk, 'yes')
+        Attendee.objects.set_rsvp(self.organizer, self.event.pk, 'no')
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(notifications.deliver_pending(), 2)
+        self.assertEqual(
+            sorted((message.subject, tuple(message.to))
+                   for message in mail.outbox),
+            [('organizer RSVPed no to Tavern Event', ('test@agiliq.com',)),
+             ('test2 RSVPed yes to Tavern Event', ('organizer@agiliq.com',)),
+             ('test2 RSVPed yes to Tavern Event', ('test@agiliq.com',))])
+        self.assertEqual(Notification.objects.pending().count(), 0)
+        self.assertEqual(notifications.deliver_pending(), 0)
+
+        for i in range(5):
+            user = User.objects.create_user(username='user%s' % i,
+                                            email='user%s@agiliq.com' % i)
+            Attendee.objects.set_rsvp(user, self.event.pk, 'yes')
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(notifications.deliver_pending(batch_size=3), 3)
+        self.assertEqual(len(large), len(small))
+        call_command('send_notifications', verbosity=0)
+        self.assertEqual(Notification.objects.pending().count(), 0)
+        self.assertEqual(len(mail.outbox), 13)
+
+    @override_settings(
+        TAVERN_NOTIFICATION_BACKEND='tavern.tests.FailingBackend',
+        TAVERN_NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_failed_delivery(self):
+        """Failed notifications are retried later, until out of attempts,
+        and then no longer due"""
+        Attendee.objects.set_rsvp(self.user, self.event.pk, 'yes')
+        self.assertEqual(notifications.deliver_pending(), 1)
+        self.assertEqual(notifications.deliver_pending(), 0)
+        notification = Notification.objects.get()
+        delay = notification.retry_at - timezone.now()
+        self.assertTrue(timedelta(0) < delay <= timedelta(
+            seconds=settings.TAVERN_NOTIFICATION_RETRY_DELAY))
+
+        Notification.objects.update(retry_at=timezone.now())
+        self.assertEqual(notifications.deliver_pending(), 1)
+        self.assertEqual(notifications.deliver_pending(), 0)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.sent_at, notification.attempts,
+                          notification.retry_at), (None, 2, None))
+        self.assertEqual(Notification.objects.pending().count(), 0)
+
+    def test_claimed_delivery(self):
+        """A batch is claimed before it is delivered, so other workers skip
+        it instead of waiting on it"""
+        Attendee.objects.set_rsvp(self.user, self.event.pk, 'yes')
+        due = []
+        messages = notifications._messages
+
+        def claimed_messages(batch):
+            due.append(Notification.objects.pending().count())
+            return messages(batch)
+
+        notifications._messages = claimed_messages
+        try:
+            self.assertEqual(notifications.deliver_pending(), 1)
+        finally:
+            notifications._messages = messages
+        self.assertEqual(due, [0])
+        notification = Notification.objects.get()
+        self.assertEqual((notification.attempts, notification.retry_at),
+                         (1, None))
+        self.assertIsNotNone(notification.sent_at)
+
+    def test_schedule_reminders(self):
+        """Each run reminds yes and maybe attendees of the events newly
+        within the lead time, once"""
+        now = timezone.now()
+        lead = timedelta(seconds=settings.TAVERN_REMINDER_LEAD_TIME)
+        soon = create_and_get_event(self.event.creator, self.group, 'Soon')
+        later = create_and_get_event(self.event.creator, self.group, 'Later')
+        hidden = create_and_get_event(self.event.creator, self.group,
+                                      'Hidden')
+        Event.objects.filter(pk=soon.pk).update(starts_at=now + lead / 2)
+        Event.objects.filter(pk=later.pk).update(
+            starts_at=now + lead + timedelta(minutes=5))
+        Event.objects.filter(pk=hidden.pk).update(starts_at=now + lead / 2,
+                                                  show=False)
+        Attendee.objects.set_rsvp(self.user, soon.pk, 'maybe')
+        Attendee.objects.set_rsvp(self.organizer, soon.pk, 'no')
+        Notification.objects.all().delete()
+
+        self.assertEqual(reminders.schedule_reminders(now), 1)
+        self.assertEqual(reminders.schedule_reminders(now), 0)
+        self.assertEqual(
+            reminders.schedule_reminders(now + timedelta(minutes=1)), 0)
+        call_command('send_notifications', verbosity=0)
+        self.assertEqual(
+            sorted((message.subject, tuple(message.to))
+                   for message in mail.outbox),
+            [('Reminder: Soon starts at %s' % (now + lead / 2),
+              ('test2@agiliq.com',)),
+             ('Reminder: Soon starts at %s' % (now + lead / 2),
+              ('test@agiliq.com',))])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                reminders.schedule_reminders(now + timedelta(minutes=10)), 1)
+        self.assertEqual(Notification.objects.pending().get().event, later)
+        self.assertEqual(len([query for query in queries
+                              if 'SAVEPOINT' not in query['sql']]), 8)
+
+    def test_short_notice_reminders(self):
+        """Events created or moved into the window after it was passed
+        are reminded of, and each start only once"""
+        now = timezone.now()
+        lead = timedelta(seconds=settings.TAVERN_REMINDER_LEAD_TIME)
+        Event.objects.filter(pk=self.event.pk).update(starts_at=now - lead)
+        reminders.schedule_reminders(now)
+        Notification.objects.all().delete()
+
+        soon = create_and_get_event(self.event.creator, self.group, 'Soon')
+        soon.starts_at = now + timedelta(hours=1)
+        soon.save()
+        self.assertEqual(reminders.schedule_reminders(now), 1)
+        self.assertEqual(reminders.schedule_reminders(now), 0)
+
+        # Moved before its reminder went out: reminded of the new start only
+        soon.starts_at = now + timedelta(hours=2)
+        soon.save()
+        self.assertEqual(reminders.schedule_reminders(now), 1)
+        self.assertEqual(
+            list(Notification.objects.pending().values_list('starts_at',
+                                                            flat=True)),
+            [soon.starts_at])
+        # Saved again at the same start: no second reminder
+        soon.description = 'Changed description'
+        soon.save()
+        self.assertEqual(reminders.schedule_reminders(now), 0)
+
+
+class TestQueryBudgets(TestCase):
+
+    def test_every_url_has_a_budget(self):
+        """A new URL has to come with a benchmark scenario"""
+        scenario_names = set(scenario.name for scenario in benchmark.SCENARIOS)
+        self.assertEqual(benchmark.url_names() - scenario_names, set())
+
+    def test_budgets(self):
+        """Every URL stays within its query budget and costs the same
+        number of queries whatever the size of the dataset"""
+        small = benchmark.run(benchmark.seed(groups=2, events=2, members=2,
+                                             attendees=2),
+                              check_time=False)
+        self.assertEqual([r['name'] for r in small if not r['ok']], [])
+
+        TavernGroup.objects.all().delete()
+        User.objects.filter(username__startswith='bench').delete()
+        large = benchmark.run(benchmark.seed(groups=10, events=6, members=12,
+                                             attendees=12),
+                              check_time=False)
+        self.assertEqual([(r['name'], r['queries']) for r in large],
+                         [(r['name'], r['queries']) for r in small])
+
+    def test_benchmark_lookups(self):
+        """The lookups are timed before and after their indexes, on the
+        older schema too"""
+        # In a process of its own, as the command sets up and tears down
+        # its own test database
+        manage = os.path.join(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))), 'manage.py')
+        handle, report = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        try:
+            subprocess.check_call(
+                [sys.executable, manage, 'benchmark_lookups', '--groups=2',
+                 '--events=2', '--members=2', '--attendees=2',
+                 '--repeat=1', '--verbosity=0', '--report=%s' % report],
+                stdout=open(os.devnull, 'w'))
+            with open(report) as results:
+                results = json.load(results)
+        finally:
+            os.remove(report)
+        names = [name for name, lookup in benchmark.LOOKUPS]
+        self.assertEqual([r['name'] for r in results['before']], names)
+        self.assertEqual([r['name'] for r in results['after']], names)
+
 
-def create_and_get_user():
-    return User.objects.create_user(username='test',
+def create_and_get_user(username='test'):
+    return User.objects.create_user(username=username,
                                     email='test@agiliq.com',
                                     password='test')
 
@@ -299,7 +1525,7 @@ def create_and_get_tavern_group(creator, name=None, organizers=None):
     return group
 
 
-def create_and_get_event(user=None, tgroup=None):
+def create_and_get_event(user=None, tgroup=None, name="Tavern Event"):
     ends_at = datetime.now() + timedelta(days=1)
 
     if user:
@@ -312,7 +1538,7 @@ def create_and_get_event(user=None, tgroup=None):
     else:
         group = create_and_get_tavern_group(creator)
     event = Event.objects.create(group=group,
-                                 name="Tavern Event",
+                                 name=name,
                                  description="Test cases",
                                  starts_at=datetime.now(),
                                  ends_at=ends_at,
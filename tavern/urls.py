@@ -4,6 +4,8 @@ from tavern import views
 
 urlpatterns = patterns('',
                        url(r'^$', views.index, name='index'),
+                       url(r'^search/$', views.search_view,
+                           name='tavern_search'),
                        url(r'^groups/(?P<slug>[\w-]+)/$',
                            views.group_details, name='tavern_group_details'),
                        url(r'^create_group/',
@@ -14,11 +16,35 @@ urlpatterns = patterns('',
                        url(r'^groups/(?P<slug>[\w-]+)/delete',
                            views.group_delete,
                            name='delete_group'),
+                       url(r'^groups/(?P<slug>[\w-]+)/events/(?P<when>upcoming|past)/$',
+                           views.group_events_feed,
+                           name='group_events_feed'),
+                       url(r'^groups/(?P<slug>[\w-]+)/members/$',
+                           views.group_members,
+                           name='group_members'),
+                       url(r'^groups/(?P<slug>[\w-]+)/members/feed/$',
+                           views.group_members_feed,
+                           name='group_members_feed'),
+                       url(r'^groups/(?P<slug>[\w-]+)/export/events/$',
+                           views.export_group_events,
+                           name='export_group_events'),
+                       url(r'^groups/(?P<slug>[\w-]+)/export/attendees/$',
+                           views.export_group_attendees,
+                           name='export_group_attendees'),
+                       url(r'^groups/(?P<slug>[\w-]+)/edit_organizers/autocomplete/$',
+                           views.organizer_autocomplete,
+                           name='organizer_autocomplete'),
                        url(r'^groups/(?P<slug>[\w-]+)/edit_organizer',
                            views.edit_organizers,
                            name='edit_organizers'),
                        url(r'^(?P<group>[\w-]+)/events/(?P<slug>[\w-]+)/$',
                            views.event_details, name='tavern_event_details'),
+                       url(r'^(?P<group>[\w-]+)/events/(?P<slug>[\w-]+)/rsvps/import/$',
+                           views.import_rsvps, name='import_rsvps'),
+                       url(r'^(?P<group>[\w-]+)/events/(?P<slug>[\w-]+)/rsvps/export/$',
+                           views.export_rsvps, name='export_rsvps'),
+                       url(r'^(?P<group>[\w-]+)/events/(?P<slug>[\w-]+)/ical/$',
+                           views.event_ical, name='tavern_event_ical'),
                        url(r'^create_event/',
                            views.create_event, name='tavern_create_event'),
                        url(r'^events/(?P<slug>[\w-]+)/update',
@@ -31,6 +57,8 @@ urlpatterns = patterns('',
                            name='tavern_toggle_member'),
                        url(r'^rsvp/(?P<event_id>\d+)/(?P<rsvp_status>\w+)/',
                            views.rsvp, name='change_rsvp'),
+                       url(r'^rsvp/statuses/$',
+                           views.rsvp_statuses, name='rsvp_statuses'),
                        url(r'^rsvp_delete/(?P<pk>\d+)/',
                            views.delete_rsvp, name='delete_rsvp'),
                        )
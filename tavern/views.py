@@ -1,19 +1,31 @@
 """ Opentavern Views"""
+import functools
+import itertools
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils import timezone
+from django.utils.http import urlencode
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse, HttpResponseRedirect, \
-    Http404
+    HttpResponseBadRequest, StreamingHttpResponse, Http404
 from django.contrib.auth.models import User
-from django.shortcuts import get_object_or_404, get_list_or_404
-from django.views.generic import DetailView
+from django.shortcuts import get_object_or_404
+from django.views.generic import View, DetailView
 from django.views.generic import CreateView, UpdateView, DeleteView
 from django.views.generic.detail import SingleObjectMixin
 
 from guardian.mixins import LoginRequiredMixin, PermissionRequiredMixin
 
-from .models import TavernGroup, Membership, Event, Attendee
+from . import bulk, exports, listings, members, pagecache, search
+from .loaders import loader_for
+from .models import TavernGroup, Membership, Event, Attendee, Notification, \
+    rsvp_message
 from .forms import CreateGroupForm, CreateEventForm, UpdateEventForm, AddOrganizerForm, RemoveOrganizerForm
 from .multiform import MultiFormsView
 
@@ -24,43 +36,156 @@ def today_date():
     return today
 
 
+def paginate(request, queryset, per_page):
+    """ Returns the page of ``queryset`` asked for in ``?page=`` """
+    paginator = Paginator(queryset, per_page)
+    try:
+        return paginator.page(request.GET.get('page'))
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+def groups_page(request, param='after', member=None):
+    """
+    The page of groups, of those ``member`` joined if given, in name
+    order after the one named in the ``param`` query parameter, and the
+    URLs of the first page and of the page after it, if not this one.
+    Other query parameters are kept, so lists of a page move on their own.
+    """
+    per_page = settings.TAVERN_GROUPS_PER_PAGE
+    after = request.GET.get(param)
+    groups = list(TavernGroup.objects.by_name(after, member=member)
+                  [:per_page + 1])
+    query = request.GET.copy()
+    first_url = next_url = None
+    if after:
+        del query[param]
+        first_url = '?%s' % query.urlencode()
+    if len(groups) > per_page:
+        groups = groups[:per_page]
+        query[param] = groups[-1].name
+        next_url = '?%s' % query.urlencode()
+    return groups, first_url, next_url
+
+
+def attachment(content, content_type, filename):
+    """ Streams ``content`` as a file download named ``filename`` """
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
+
+def index_scopes(**kwargs):
+    """ The anonymous index lists the groups with their member counts """
+    return [pagecache.SITE_WIDE]
+
+
+@pagecache.cache_anonymous_page(index_scopes)
 def index(request, template='tavern/home.html'):
-    """ index page """
-    all_groups = TavernGroup.objects.all()
-    if request.user.is_authenticated():
-        joined_groups = request.user.tavern_groups.all()
-        unjoined_groups = list(set(all_groups) - set(joined_groups))
-        upcoming_events = Event.visible_events.upcoming()
-        events_rsvped = request.user.events_attending.all()
+    """
+    index page
 
-        context = {'joined_groups': joined_groups,
+    Groups are listed a page at a time, by name keyset. Logged in users
+    get their own groups paged the same way on their own cursor, and only
+    the groups of the page are checked for membership. Query budget:
+
+    * anonymous: 1 (group page), none when cached
+    * logged in: 6 (session, user, group page, memberships in the page,
+      joined groups, rsvped events), plus 1 for the user's RSVPs to the
+      upcoming events when there are some, and 2 when these are not
+      cached
+    """
+    groups, first_url, next_url = groups_page(request)
+    if request.user.is_authenticated():
+        TavernGroup.objects.with_membership(groups, request.user)
+        joined_groups, joined_first_url, joined_next_url = groups_page(
+            request, 'joined_after', member=request.user)
+        unjoined_groups = [group for group in groups if not group.is_member]
+
+        events_limit = settings.TAVERN_EVENTS_LIMIT
+        upcoming_events = listings.upcoming_events()
+        loader_for(request).want_rsvp_statuses(upcoming_events)
+        events_rsvped = request.user.events_attending.select_related(
+            'group')[:events_limit]
+
+        context = {'groups': groups,
+                   'first_url': first_url,
+                   'next_url': next_url,
+                   'joined_groups': joined_groups,
+                   'joined_first_url': joined_first_url,
+                   'joined_next_url': joined_next_url,
                    'unjoined_groups': unjoined_groups,
                    'upcoming_events': upcoming_events,
                    'events_rsvped': events_rsvped}
     else:
-        context = {'groups': all_groups}
+        context = {'groups': groups,
+                   'first_url': first_url,
+                   'next_url': next_url}
     return render(request, template, context)
 
 
+def search_view(request, template='tavern/search.html'):
+    """
+    Groups and events matching the words of ``?q=``, best first, a page
+    at a time. Query budget: 3 (matches, groups, events).
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    results, has_next = search.search(query, page)
+    context = {'query': query,
+               'results': results,
+               'page': page,
+               'has_next': has_next}
+    return render(request, template, context)
+
+
+# Most event ids ``rsvp_statuses`` answers for at once
+MAX_RSVP_STATUSES = 100
+
+
+def rsvp_statuses(request):
+    """
+    The requesting user's RSVP status to each of the events of the comma
+    separated ids ``?events=``, null where they haven't, as JSON. Query
+    budget: 3 (session, user, RSVPs).
+    """
+    try:
+        event_ids = set(int(event_id) for event_id in
+                        request.GET.get('events', '').split(',') if event_id)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid event ids")
+    if len(event_ids) > MAX_RSVP_STATUSES:
+        return HttpResponseBadRequest("Too many event ids")
+    statuses = loader_for(request).rsvp_statuses(event_ids)
+    return HttpResponse(json.dumps({'statuses': statuses}),
+                        content_type='application/json')
+
+
 @login_required
 def rsvp(request, event_id, rsvp_status):
-    """ View to set RSVP status for an event """
-    event = get_object_or_404(Event, id=int(event_id))
-    user = get_object_or_404(User, id=request.user.id)
+    """
+    View to set RSVP status for an event. Answers with the new status,
+    its message and the event's RSVP counts as JSON.
+    """
+    if rsvp_status not in dict(Attendee.RSVP_CHOICES):
+        return HttpResponseBadRequest("Invalid RSVP status")
     try:
-        attendee = Attendee.objects.get(user=user,
-                                        event=event)
-        attendee.rsvp_status = rsvp_status
-        attendee.rsvped_on = timezone.now()
-        attendee.save()
-    except Attendee.DoesNotExist:
-        attendee = Attendee.objects.create(user=user,
-                                           event=event,
-                                           rsvp_status=rsvp_status,
-                                           rsvped_on=timezone.now())
-
-    message = attendee.get_rsvp()
-    return HttpResponse(message)
+        attendee = Attendee.objects.set_rsvp(request.user, int(event_id),
+                                             rsvp_status)
+    except Event.DoesNotExist:
+        raise Http404
+    event = attendee.event
+    data = {'status': attendee.rsvp_status,
+            'message': attendee.get_rsvp(),
+            'counts': {'yes': event.yes_count,
+                       'no': event.no_count,
+                       'maybe': event.maybe_count}}
+    return HttpResponse(json.dumps(data), content_type='application/json')
 
 
 @login_required
@@ -71,25 +196,57 @@ def tavern_toggle_member(request):
     """
 
     user = get_object_or_404(User, id=request.POST.get('user_id'))
-    group = get_object_or_404(TavernGroup, slug=request.POST.get('slug'))
-    try:
-        member = Membership.objects.get(user=user, tavern_group=group)
-        response = "Join Group"
-        member.delete()
-    except Membership.DoesNotExist:
-        member = Membership.objects.create(
-            user=user,
-            tavern_group=group,
-            join_date=today_date())
-        response = "Unjoin Group"
+    with transaction.atomic():
+        # Locked, so concurrent toggles of the group's memberships see
+        # each other's changes and its member count stays exact
+        group = get_object_or_404(TavernGroup.objects.select_for_update(),
+                                  slug=request.POST.get('slug'))
+        try:
+            member = Membership.objects.get(user=user, tavern_group=group)
+            response = "Join Group"
+            member.delete()
+            group.update_member_count(-1)
+            Notification.objects.membership(user, group, joined=False)
+            pagecache.invalidate(pagecache.SITE_WIDE,
+                                 pagecache.members_scope(group.pk))
+        except Membership.DoesNotExist:
+            member = Membership.objects.create(
+                user=user,
+                tavern_group=group,
+                join_date=today_date())
+            response = "Unjoin Group"
+            group.update_member_count(1)
+            Notification.objects.membership(user, group, joined=True)
     return HttpResponse(response)
 
 
+def more_events_url(group, when, events):
+    """ URL of the page of events after ``events``, if there may be one """
+    cursor = listings.next_cursor(events)
+    if cursor is None:
+        return None
+    return '%s?after=%s' % (reverse('group_events_feed',
+                                    kwargs={'slug': group.slug,
+                                            'when': when}), cursor)
+
+
 class UpcomingEventsMixin(object):
-    """ Add upcoming events to the view """
+    """
+    Add upcoming events to the view, site-wide or of the group returned
+    by ``get_listing_group``
+    """
+    def get_listing_group(self):
+        return None
+
     def get_context_data(self, **kwargs):
         context = super(UpcomingEventsMixin, self).get_context_data(**kwargs)
-        context['upcoming_events'] = Event.visible_events.upcoming()
+        group = self.get_listing_group()
+        upcoming_events = listings.upcoming_events(group and group.pk)
+        context['upcoming_events'] = upcoming_events
+        loader_for(self.request).want_rsvp_statuses(upcoming_events)
+        if group is not None:
+            context['upcoming_more_url'] = more_events_url(group, 'upcoming',
+                                                           upcoming_events)
         return context
 
 
@@ -99,65 +256,217 @@ class GroupDetail(UpcomingEventsMixin, DetailView):
     context_object_name = "group"
     model = TavernGroup
 
+    def get_listing_group(self):
+        return self.object
+
     def get_context_data(self, **kwargs):
         context = super(GroupDetail, self).get_context_data(**kwargs)
-        context['past_events'] = Event.visible_events.past()
+        past_events = listings.past_events(self.object.pk)
+        context['past_events'] = past_events
+        loader_for(self.request).want_rsvp_statuses(past_events)
+        context['past_more_url'] = more_events_url(self.object, 'past',
+                                                   past_events)
 
         tavern_group = context['group']
-        try:
-            Membership.objects.get(tavern_group=tavern_group,
-                                   user=self.request.user.id)
-            user_is_member = True
-        except Membership.DoesNotExist:
-            user_is_member = False
-        context['user_is_member'] = user_is_member
+        context['user_is_member'] = loader_for(self.request).is_member(
+            tavern_group)
 
-        recent_group_members = get_list_or_404(Membership, tavern_group=tavern_group)[:5]
-        context["recent_group_members"] = recent_group_members
+        # Only looked up when the cached fragment listing them is stale
+        context["recent_group_members"] = functools.partial(
+            members.recent_members, tavern_group.pk)
+        context['members_version'] = pagecache.version(
+            pagecache.members_scope(tavern_group.pk), pagecache.USERS)
+        context['fragment_timeout'] = settings.TAVERN_PAGE_CACHE_TIMEOUT
 
         return context
 
 
-class EventDetail(UpcomingEventsMixin, DetailView):
-    """ Give details about an event and its attendees"""
+def group_id_of(slug):
+    """ The id of the group ``slug``, None if missing; usually cached """
+    return pagecache.lookup(
+        'group:%s' % slug, [pagecache.SITE_WIDE],
+        lambda: TavernGroup.objects.filter(slug=slug).values_list(
+            'pk', flat=True).first())
+
+
+def group_scopes(slug):
+    """ What the group page shows, to version its cached renders """
+    group_id = group_id_of(slug)
+    if group_id is None:
+        return None
+    return [pagecache.group_scope(group_id),
+            pagecache.members_scope(group_id),
+            pagecache.events_scope(group_id)]
+
+
+def group_last_modified(slug):
+    """
+    When the group page last changed: its group or one of the group's
+    events was saved, joined or RSVPed to, or an event of the group
+    started. Costs two queries.
+    """
+    group = TavernGroup.objects.filter(slug=slug).annotate(
+        events_updated_at=Max('event__updated_at')).values_list(
+        'updated_at', 'events_updated_at').first()
+    if group is None:
+        return None
+    started_at = Event.visible_events.filter(
+        group__slug=slug, starts_at__lte=timezone.now()).aggregate(
+        started_at=Max('starts_at'))['started_at']
+    return max(when for when in group + (started_at,) if when is not None)
+
+
+def group_events_feed(request, slug, when):
+    """
+    The next page of a group's upcoming or past events, after the
+    ``after`` cursor, as JSON: the events and the URL of the page after.
+    """
+    group = get_object_or_404(TavernGroup, slug=slug)
+    try:
+        events = listings.more_events(group.pk, when, request.GET['after'])
+    except (KeyError, ValueError, OverflowError):
+        return HttpResponseBadRequest("Invalid or missing after cursor")
+    data = {'events': [{'id': event.pk,
+                        'name': event.name,
+                        'url': event.get_absolute_url(),
+                        'starts_at': event.starts_at.isoformat(),
+                        'yes_count': event.yes_count}
+                       for event in events],
+            'next': more_events_url(group, when, events)}
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+def members_url(group, page):
+    """ URL of the page of members after ``page``, if there may be one """
+    cursor = members.next_cursor(page)
+    if cursor is None:
+        return None
+    return '%s?after=%s' % (reverse('group_members_feed',
+                                    kwargs={'slug': group.slug}), cursor)
+
+
+def group_members(request, slug, template='tavern/group_members.html'):
+    """
+    Directory of a group's members, latest to join first, continued
+    through ``group_members_feed``. Query budget: 2 (group, members).
+    """
+    group = get_object_or_404(TavernGroup, slug=slug)
+    page = members.members_page(group.pk)
+    context = {'group': group,
+               'members': page,
+               'more_url': members_url(group, page)}
+    return render(request, template, context)
+
+
+def group_members_feed(request, slug):
+    """
+    The next page of a group's members, after the ``after`` cursor, as
+    JSON: the members and the URL of the page after.
+    """
+    group = get_object_or_404(TavernGroup, slug=slug)
+    try:
+        page = members.members_page(group.pk, request.GET['after'])
+    except (KeyError, ValueError, OverflowError):
+        return HttpResponseBadRequest("Invalid or missing after cursor")
+    data = {'members': [{'name': member.get_name(),
+                         'join_date': member.join_date.isoformat()}
+                        for member in page],
+            'next': members_url(group, page)}
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+class GroupEventMixin(object):
+    """ Looks the event up, once, by its group's slug and its own """
+
+    def get_event_queryset(self):
+        return Event.objects.select_related('group')
+
+    def get_object(self, queryset=None):
+        if getattr(self, 'object', None) is None:
+            try:
+                self.object = self.get_event_queryset().get(
+                    group__slug=self.kwargs['group'], slug=self.kwargs['slug'])
+            except Event.DoesNotExist:
+                raise Http404
+        return self.object
+
+
+def event_scopes(group, slug):
+    """ What the event page shows, to version its cached renders """
+    group_id = group_id_of(group)
+    if group_id is None:
+        return None
+    event_id = pagecache.lookup(
+        'event:%s:%s' % (group_id, slug), [pagecache.events_scope(group_id)],
+        lambda: Event.objects.filter(group_id=group_id, slug=slug)
+        .values_list('pk', flat=True).first())
+    if event_id is None:
+        return None
+    return [pagecache.group_scope(group_id), pagecache.event_scope(event_id)]
+
+
+def event_last_modified(group, slug):
+    """
+    When the event page last changed: the event or its group was saved
+    or the event RSVPed to, or the event started or ended. Costs one
+    query.
+    """
+    event = Event.visible_events.filter(group__slug=group, slug=slug) \
+        .values_list('updated_at', 'group__updated_at', 'starts_at',
+                     'ends_at').first()
+    if event is None:
+        return None
+    updated_at, group_updated_at, starts_at, ends_at = event
+    now = timezone.now()
+    return max([updated_at, group_updated_at] +
+               [when for when in (starts_at, ends_at)
+                if when is not None and when <= now])
+
+
+class EventDetail(GroupEventMixin, DetailView):
+    """
+    Give details about an event and its attendees, a page at a time.
+    Query budget: 3 (event with its group and creator, attendee count,
+    attendee page) however many attendees there are, plus the session,
+    user, RSVP and permissions of logged in users. Anonymous visitors
+    are served from the page cache; the attendee list is a cached
+    fragment for everybody. Conditional GETs are first checked against
+    ``event_last_modified``, and answered 304 when nothing changed; the
+    ids ``event_scopes`` maps the URL to cost one more query when these
+    are not cached.
+    """
     template_name = "tavern/event_details.html"
     context_object_name = "event"
     model = Event
-    queryset = Event.visible_events.all()
+
+    def get_event_queryset(self):
+        return Event.visible_events.select_related('group', 'creator')
 
     def get_context_data(self, **kwargs):
         context = super(EventDetail, self).get_context_data(**kwargs)
-        event_name = self.kwargs['slug']
-        group_name = self.kwargs['group']
-        group = TavernGroup.objects.get(slug=group_name)
-        event = group.event_set.get(slug=event_name)
-        try:
-            attendee = Attendee.objects.get(user_id=self.request.user.id,
-                                            event=event)
-            message = attendee.get_rsvp()
+        event = self.object
+        attendee = None
+        if self.request.user.is_authenticated():
+            attendee = Attendee.objects.with_rsvp_messages().filter(
+                user=self.request.user, event=event).first()
+        if attendee is not None:
+            attendee.event = event
             context['attendee'] = attendee
-        except Attendee.DoesNotExist:
-            if timezone.now() <= event.ends_at:
-                message = "You have not rsvped"
-            else:
-                message = "You did not rsvp"
-        context['attendee_rsvp'] = message
-
-        context['event_attendees'] = Attendee.objects.filter(event=event,
-                                                             rsvp_status="yes")
+            context['attendee_rsvp'] = attendee.get_rsvp()
+        else:
+            context['attendee_rsvp'] = rsvp_message(None, event.is_over())
+
+        context['event_attendees'] = paginate(
+            self.request,
+            event.attendee_set.filter(rsvp_status="yes").select_related(
+                'user').order_by('rsvped_on', 'pk'),
+            settings.TAVERN_ATTENDEES_PER_PAGE)
         context['editable'] = event.starts_at > timezone.now()
+        context['attendees_version'] = pagecache.version(
+            pagecache.event_scope(event.pk), pagecache.USERS)
+        context['fragment_timeout'] = settings.TAVERN_PAGE_CACHE_TIMEOUT
         return context
 
-    def get_object(self, **kwargs):
-        group_name = self.kwargs['group']
-        event_name = self.kwargs['slug']
-        try:
-            group = TavernGroup.objects.get(slug=group_name)
-            event = group.event_set.get(slug=event_name)
-        except Event.DoesNotExist:
-            raise Http404
-        return event
-
 
 class GroupCreate(LoginRequiredMixin, CreateView):
     """ Create new group """
@@ -208,17 +517,21 @@ class EditOrganizers(LoginRequiredMixin, PermissionRequiredMixin, SingleObjectMi
         self.object = self.get_object()
         return super(EditOrganizers, self).post(request, *args, **kwargs)
 
-    def get_remove_initial(self):
-        return {'group': self.object.pk}
+    def get_form_kwargs(self, form_name, bind_form=False):
+        kwargs = super(EditOrganizers, self).get_form_kwargs(form_name,
+                                                             bind_form)
+        kwargs['group'] = self.object
+        return kwargs
 
     def add_form_valid(self, form):
-        for user in form.cleaned_data['users']:
-            self.object.organizers.add(user)
+        # One add, so permissions are synced once for all the users
+        with transaction.atomic():
+            self.object.organizers.add(*form.cleaned_data['users'])
         return HttpResponseRedirect(self.get_success_url())
 
     def remove_form_valid(self, form):
-        for user in form.cleaned_data['users']:
-            self.object.organizers.remove(user)
+        with transaction.atomic():
+            self.object.organizers.remove(*form.cleaned_data['users'])
         return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self, **kwargs):
@@ -265,18 +578,157 @@ class RsvpDelete(LoginRequiredMixin, DeleteView):
     """ Remove a RSVP"""
     model = Attendee
 
+    def delete(self, request, *args, **kwargs):
+        with transaction.atomic():
+            # The event is locked as in Attendee.objects.set_rsvp, so a
+            # concurrent removal of the same RSVP finds it gone and
+            # answers 404 instead of counting it out twice
+            event = get_object_or_404(Event.objects.select_for_update(),
+                                      attendee__pk=self.kwargs['pk'])
+            self.object = self.get_object()
+            self.object.event = event
+            success_url = self.get_success_url()
+            self.object.delete()
+            event.update_rsvp_counts(old_status=self.object.rsvp_status)
+            Notification.objects.rsvp_removed(self.object)
+        pagecache.invalidate(pagecache.events_scope(event.group_id),
+                             pagecache.event_scope(event.pk))
+        return HttpResponseRedirect(success_url)
+
     def get_success_url(self, **kwargs):
         return reverse("tavern_event_details", kwargs={"slug": self.object.event.slug,
                                                        "group": self.object.event.group.slug})
 
 
+class RsvpImport(LoginRequiredMixin, PermissionRequiredMixin, GroupEventMixin, View):
+    """
+    Sets many RSVPs of an event at once from an uploaded ``file`` of
+    ``username,rsvp_status`` CSV rows, or of JSON objects, one per line,
+    with ``format=json``. Answers with a JSON summary.
+    """
+    permission_required = 'tavern.change_event'
+    render_403 = True
+    return_403 = True
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return HttpResponseBadRequest("No file uploaded")
+        if request.POST.get('format') == 'json':
+            rows = bulk.read_json_lines(upload)
+        else:
+            rows = bulk.read_csv(upload)
+        summary = bulk.import_rsvps(self.get_object(), rows)
+        return HttpResponse(json.dumps(summary), content_type='application/json')
+
+
+class RsvpExport(LoginRequiredMixin, PermissionRequiredMixin, GroupEventMixin, View):
+    """
+    Streams the RSVPs of an event as CSV, or as JSON objects, one per
+    line, with ``?format=json``.
+    """
+    permission_required = 'tavern.change_event'
+    render_403 = True
+    return_403 = True
+
+    def get(self, request, *args, **kwargs):
+        event = self.get_object()
+        rows = bulk.export_rsvps(event)
+        fields = ('username', 'rsvp_status', 'rsvped_on')
+        if request.GET.get('format') == 'json':
+            return attachment(bulk.stream_json_lines(rows, fields),
+                              'application/x-ndjson',
+                              '%s-rsvps.json' % event.slug)
+        return attachment(bulk.stream_csv(itertools.chain([fields], rows)),
+                          'text/csv', '%s-rsvps.csv' % event.slug)
+
+
+class GroupEventsExport(SingleObjectMixin, View):
+    """
+    Streams the visible events of a group as CSV, or as an iCalendar
+    feed with ``?format=ics``.
+    """
+    model = TavernGroup
+
+    def get(self, request, *args, **kwargs):
+        group = self.get_object()
+        if request.GET.get('format') == 'ics':
+            return attachment(exports.group_ical(group, request.get_host()),
+                              'text/calendar; charset=utf-8',
+                              '%s-events.ics' % group.slug)
+        rows = itertools.chain([exports.EVENT_FIELDS],
+                               exports.group_events(group))
+        return attachment(bulk.stream_csv(rows), 'text/csv',
+                          '%s-events.csv' % group.slug)
+
+
+class OrganizerAutocomplete(LoginRequiredMixin, PermissionRequiredMixin, SingleObjectMixin, View):
+    """
+    Usernames starting with ``?q=``, to suggest when editing a group's
+    organizers, as JSON
+    """
+    model = TavernGroup
+    permission_required = 'tavern.delete_taverngroup'
+    render_403 = True
+    return_403 = True
+
+    def get(self, request, *args, **kwargs):
+        self.get_object()
+        prefix = request.GET.get('q', '').strip()
+        usernames = []
+        if prefix:
+            # On PostgreSQL, answered from the pattern index Django keeps
+            # for the unique username
+            usernames = list(User.objects.filter(username__startswith=prefix)
+                             .order_by('username').values_list('username', flat=True)
+                             [:settings.TAVERN_AUTOCOMPLETE_LIMIT])
+        return HttpResponse(json.dumps({'usernames': usernames}),
+                            content_type='application/json')
+
+
+class GroupAttendeesExport(LoginRequiredMixin, PermissionRequiredMixin, SingleObjectMixin, View):
+    """ Streams the RSVPs to all the events of a group as CSV """
+    model = TavernGroup
+    permission_required = 'tavern.change_taverngroup'
+    render_403 = True
+    return_403 = True
+
+    def get(self, request, *args, **kwargs):
+        group = self.get_object()
+        rows = itertools.chain([exports.ATTENDEE_FIELDS],
+                               exports.group_attendees(group))
+        return attachment(bulk.stream_csv(rows), 'text/csv',
+                          '%s-attendees.csv' % group.slug)
+
+
+class EventIcal(GroupEventMixin, View):
+    """ An event as an iCalendar file, to add it to a calendar """
+
+    def get(self, request, *args, **kwargs):
+        event = self.get_object()
+        if not event.show:
+            raise Http404
+        return attachment(exports.event_ical(event, request.get_host()),
+                          'text/calendar; charset=utf-8',
+                          '%s.ics' % event.slug)
+
+
 tavern_group_update = GroupUpdate.as_view()
 tavern_event_update = EventUpdate.as_view()
 create_group = GroupCreate.as_view()
 create_event = EventCreate.as_view()
-event_details = EventDetail.as_view()
-group_details = GroupDetail.as_view()
+event_details = pagecache.conditional_page(event_scopes, event_last_modified)(
+    pagecache.cache_anonymous_page(event_scopes)(EventDetail.as_view()))
+group_details = pagecache.conditional_page(group_scopes, group_last_modified)(
+    pagecache.cache_anonymous_page(group_scopes)(GroupDetail.as_view()))
 group_delete = GroupDelete.as_view()
 event_delete = EventDelete.as_view()
 delete_rsvp = RsvpDelete.as_view()
 edit_organizers = EditOrganizers.as_view()
+organizer_autocomplete = OrganizerAutocomplete.as_view()
+import_rsvps = RsvpImport.as_view()
+export_rsvps = RsvpExport.as_view()
+export_group_events = GroupEventsExport.as_view()
+export_group_attendees = GroupAttendeesExport.as_view()
+event_ical = EventIcal.as_view()